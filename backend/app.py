@@ -1,13 +1,20 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from jinja2 import Environment, FileSystemLoader, select_autoescape
+from contextlib import asynccontextmanager
+import asyncio
+import gzip
+import hashlib
+import importlib
 import os
 import time
-from .config import load_config
-from .wmata import rail_predictions, bus_predictions, incidents
-from .bikeshare import bike_status
-from .weather import current_weather
+from .config import DEFAULT_PROFILE, changed_sections, config_service, profile_config, profile_names
+from . import history, metrics, policy, serialize, store
+from .breaker import UPSTREAMS, breaker_for, breakers
+from .budget import budgets
+from .cache import cache
+from .scheduler import Job, Scheduler
 import logging
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -19,59 +26,499 @@ env = Environment(
     autoescape=select_autoescape(['html', 'xml'])
 )
 
-app = FastAPI()
-app.mount('/static', StaticFiles(directory=STATIC_DIR), name='static')
+# Provider modules pull in httpx; they are imported once the app is serving
+PROVIDER_MODULES = ("upstream", "wmata", "bikeshare", "weather")
 
 
-def build_summary(cfg: dict, mock: bool):
-    now = int(time.time())
-    return {
-        "updated_at": now,
-        "rail": rail_predictions(cfg, mock=mock),
-        "bus": bus_predictions(cfg, mock=mock),
-        "bike": bike_status(cfg, mock=mock) if cfg.get("bike_share", {}).get("enabled", True) else {"stations": []},
-        "weather": current_weather(cfg, mock=mock),
-        "incidents": incidents(cfg, mock=mock),
-    }
+def _provider(module, name):
+    """``module.name``, imported on first call rather than with the app."""
+    async def call(cfg, **kwargs):
+        fn = getattr(importlib.import_module(f".{module}", __package__), name)
+        return await fn(cfg, **kwargs)
+    call.__name__ = name
+    return call
 
 
-@app.get('/', response_class=HTMLResponse)
-async def index(request: Request):
-    template = env.get_template('index.html')
-    html = template.render()
-    return HTMLResponse(content=html)
+rail_predictions_async = _provider("wmata", "rail_predictions_async")
+bus_predictions_async = _provider("wmata", "bus_predictions_async")
+incidents_async = _provider("wmata", "incidents_async")
+bike_status_async = _provider("bikeshare", "bike_status_async")
+current_weather_async = _provider("weather", "current_weather_async")
+hourly_forecast_async = _provider("weather", "hourly_forecast_async")
+weather_alerts_async = _provider("weather", "weather_alerts_async")
 
+_booting = None     # startup still importing providers and starting schedulers
 
-@app.get('/v1/summary', response_class=JSONResponse)
-async def summary():
-    cfg = load_config()
+
+@asynccontextmanager
+async def lifespan(app):
+    global _booting
+    cfg = config_service.get()
+    store.configure(cfg.get("data_dir"))
+    _apply_limits(cfg)
+    # The page is served at once; summaries wait for the rest of startup
+    _booting = asyncio.create_task(_boot(cfg))
+    watch = asyncio.create_task(_watch_loop())
+    try:
+        yield
+    finally:
+        for task in (_booting, watch):
+            task.cancel()
+        await asyncio.gather(_booting, watch, return_exceptions=True)
+        for sched in schedulers.values():
+            await sched.stop()
+        from . import upstream
+        await upstream.close_pool()
+        await asyncio.to_thread(history.recorder.close)
+
+
+async def _boot(cfg):
+    for module in PROVIDER_MODULES:
+        # Off the loop, so the page is served while they load
+        await asyncio.to_thread(importlib.import_module, f".{module}", __package__)
+    from . import upstream
+    # Reference data from the last run, so the board renders before the network is up
+    store.warm(cache)
+    await upstream.open_pool(cfg.get("http", {}))
+    # An edit while the providers loaded is already in the current config
+    cfg = config_service.get()
+    if cfg.get("scheduler", {}).get("enabled", True):
+        # One scheduler per display profile; they share the provider cache, so
+        # a station or stop configured on several profiles is fetched once.
+        for name in profile_names(cfg):
+            schedulers.setdefault(name, _new_scheduler(name)).start()
+
+
+LOOP_CHECK_S = 0.25
+
+
+async def _watch_loop():
+    # A wakeup that runs late means callbacks are queued behind slow work
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_CHECK_S)
+        metrics.loop_lag_seconds.observe(max(0.0, time.perf_counter() - start - LOOP_CHECK_S))
+
+
+async def _started():
+    if _booting is not None and not _booting.done():
+        await asyncio.shield(_booting)
+
+
+def _apply_limits(cfg):
+    opts = dict(cfg.get("cache", {}))
+    if opts.get("shared") is True:
+        opts["shared"] = store.shared_path()
+    cache.configure(**opts)
+    hist = cfg.get("history", {})
+    history.recorder.configure(**dict(hist, dir=hist.get("dir") or store.history_dir()))
+    for name in UPSTREAMS:
+        breaker_for(name).configure(**cfg.get("breaker", {}))
+    for name, limits in cfg.get("budget", {}).items():
+        if name in budgets:
+            budgets[name].configure(**limits)
+
+
+def _on_config_change(old, new):
+    """Apply an edited config.yaml without a restart: retune the cache and
+    budgets, start/stop profile schedulers (all of them when
+    ``scheduler.enabled`` changes), and refresh only the jobs whose config
+    sections changed."""
+    _apply_limits(new)
+    for key in ("http", "data_dir"):
+        if old.get(key) != new.get(key):
+            logging.warning("config: %s changes take effect after a restart", key)
+    if _booting is None or not _booting.done():
+        # Startup starts the schedulers from the config current by then
+        return
+    enabled = new.get("scheduler", {}).get("enabled", True)
+    names = profile_names(new) if enabled else []
+    for name in list(schedulers):
+        if name not in names:
+            asyncio.get_running_loop().create_task(schedulers.pop(name).stop())
+            _encoded.pop(name, None)
+    for name in names:
+        if name not in schedulers:
+            schedulers[name] = _new_scheduler(name)
+            schedulers[name].start()
+            continue
+        try:
+            changed = changed_sections(profile_config(old, name), profile_config(new, name))
+        except KeyError:
+            changed = {"home"}
+        jobs = [key for key, _, _, _, section, _ in SECTIONS
+                if section in changed or ("home" in changed and key != "incidents")]
+        schedulers[name].refresh_now(jobs)
+
+
+config_service.subscribe(_on_config_change)
+
+
+class VersionedStaticFiles(StaticFiles):
+    """Static files; versioned URLs (``?v=<hash>``, as the page links them)
+    are cached for a year, anything else is revalidated."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        versioned = b"v=" in scope.get("query_string", b"")
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if versioned else "no-cache"
+        return response
+
+
+def static_url(name):
+    """``/static/<name>?v=<content hash>``: a new file gets a new URL."""
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        return f"/static/{name}?v={hashlib.sha1(f.read()).hexdigest()[:12]}"
+
+
+env.globals["static_url"] = static_url
+
+app = FastAPI(lifespan=lifespan)
+app.mount('/static', VersionedStaticFiles(directory=STATIC_DIR), name='static')
+
+
+def _timeout(cfg, section):
+    return float(cfg.get(section, {}).get("timeout_s", 8))
+
+
+async def _bike(cfg):
+    if not cfg.get("bike_share", {}).get("enabled", True):
+        return {"stations": []}
+    return await bike_status_async(cfg)
+
+
+async def _hourly(cfg):
+    return await hourly_forecast_async(cfg, hours=12)
+
+
+# (summary key, error label, provider, fallback, config section, fixed refresh_s)
+SECTIONS = (
+    ("rail", "wmata_rail", rail_predictions_async, {"stations": []}, "rail", None),
+    ("bus", "wmata_bus", bus_predictions_async, {"stops": []}, "bus", None),
+    ("bike", "bikeshare", _bike, {"stations": []}, "bike_share", None),
+    ("weather_now", "weather_now", current_weather_async, {}, "weather", None),
+    ("weather_hourly", "weather_hourly", _hourly, [], "weather", None),
+    ("weather_alerts", "weather_alerts", weather_alerts_async, [], "weather", 300),
+    ("incidents", "wmata_incidents", incidents_async, [], "rail", 60),
+)
+
+
+async def _run_section(key, provider, section, cfg):
+    timeout_s = _timeout(cfg, section)
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(provider(cfg), timeout_s)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"timed out after {timeout_s:g}s") from None
+    finally:
+        metrics.provider_seconds.observe(time.perf_counter() - start, key)
+
+
+# Sections that spend the WMATA key's budget, and at which priority
+BUDGET_PRIORITY = {"rail": "rail", "bus": "bus", "incidents": "incidents"}
+
+
+def _job(key, provider, section, refresh_s, profile=DEFAULT_PROFILE):
+    def interval(cfg, value):
+        base = refresh_s or cfg.get(section, {}).get("refresh_s", 60)
+        # Tighten or relax from the last payload and the time of day
+        base = policy.interval(key, value, cfg, base)
+        priority = BUDGET_PRIORITY.get(key)
+        # Stretch lower priorities first when the key is close to its limits
+        return base * budgets["wmata"].stretch(priority) if priority else base
+
+    async def run(cfg):
+        if not refresh_s and job.interval_s is not None:
+            # Provider caches expire after the section's refresh_s; match them
+            # to the chosen interval so a tightened refresh reaches the upstream
+            cfg = {**cfg, section: {**cfg.get(section, {}), "refresh_s": job.interval_s}}
+        value = await _run_section(key, provider, section, cfg)
+        if profile in cfg.get("history", {}).get("profiles", ()):
+            history.recorder.record(key, value)
+        return value
+
+    # The page counts rail and bus minutes down from their last fetch
+    job = Job(key, run, interval, stamped=key in ("rail", "bus"))
+    return job
+
+
+def _new_scheduler(profile):
+    jobs = [_job(key, p, section, r, profile) for key, _, p, _, section, r in SECTIONS]
+    return Scheduler(jobs, lambda: config_service.profile(profile))
+
+
+schedulers = {}
+
+
+async def build_summary(cfg: dict, scheduler=None, timings=None):
+    """``timings``, if given, is filled with each section's provider seconds."""
     errors = []
+    timings = {} if timings is None else timings
+    fetched = {}    # key -> when the value shown was fetched
 
-    def safe(name, callable_, fallback):
+    async def live(key, label, provider, fallback, section):
+        start = time.perf_counter()
+        fetched[key] = time.time()
         try:
-            return callable_()
+            return await _run_section(key, provider, section, cfg)
         except Exception as e:
-            logging.exception("%s provider error: %s", name, e)
-            errors.append(f"{name}: {e}")
+            logging.exception("%s provider error: %s", label, e)
+            errors.append(f"{label}: {e}")
             return fallback
+        finally:
+            timings[key] = time.perf_counter() - start
+
+    def cached(key, label, fallback):
+        job = scheduler.jobs[key]
+        timings[key] = job.duration_s
+        fetched[key] = job.updated_at
+        if job.error:
+            errors.append(f"{label}: {job.error}")
+        elif job.updated_at is None:
+            errors.append(f"{label}: not loaded yet")
+        return job.value if job.updated_at is not None else fallback
+
+    # Providers are independent; run them concurrently so a cold summary costs
+    # roughly the slowest upstream rather than the sum of all of them.
+    if scheduler is not None and scheduler.running:
+        # Warm path: the scheduler owns refreshes; only wait on a cold start.
+        # Once every job is ready this never suspends, so concurrent callers
+        # can't interleave a rebuild.
+        pending = [(key, section) for key, _, _, _, section, _ in SECTIONS if not scheduler.jobs[key].ready.is_set()]
+        if pending:
+            await asyncio.gather(*(scheduler.wait_ready(key, _timeout(cfg, section)) for key, section in pending))
+        results = [cached(key, label, fallback) for key, label, _, fallback, _, _ in SECTIONS]
+    else:
+        results = await asyncio.gather(*(live(key, label, provider, fallback, section)
+                                         for key, label, provider, fallback, section, _ in SECTIONS))
+    values = dict(zip((key for key, *_ in SECTIONS), results))
 
-    rail = safe("wmata_rail", lambda: rail_predictions(cfg), {"stations": []})
-    bus = safe("wmata_bus", lambda: bus_predictions(cfg), {"stops": []})
-    bike = {"stations": []}
-    if cfg.get("bike_share", {}).get("enabled", True):
-        bike = safe("bikeshare", lambda: bike_status(cfg), {"stations": []})
-    from .weather import current_weather, hourly_forecast, weather_alerts
-    weather_now = safe("weather_now", lambda: current_weather(cfg), {})
-    weather_hourly = safe("weather_hourly", lambda: hourly_forecast(cfg, hours=12), [])
-    alerts = safe("weather_alerts", lambda: weather_alerts(cfg), [])
-    inc = safe("wmata_incidents", lambda: incidents(cfg), [])
-
-    return JSONResponse(content={
+    return {
         "updated_at": int(time.time()),
-        "rail": rail,
-        "bus": bus,
-        "bike": bike,
-        "weather": {"now": weather_now, "hourly": weather_hourly, "alerts": alerts},
-        "incidents": inc,
+        "rail": values["rail"],
+        "bus": values["bus"],
+        "bike": values["bike"],
+        "weather": {"now": values["weather_now"], "hourly": values["weather_hourly"], "alerts": values["weather_alerts"]},
+        "incidents": values["incidents"],
         "errors": errors,
-    })
+        # The page counts rail and bus minutes down from these
+        "fetched_at": {key: int(fetched[key]) for key in ("rail", "bus") if fetched.get(key)},
+    }
+
+
+# The page has no per-request content: rendered once, with its ETag
+_index = None
+
+
+@app.get('/', response_class=HTMLResponse)
+async def index(request: Request):
+    global _index
+    if _index is None:
+        html = env.get_template('index.html').render().encode()
+        _index = (html, '"%s"' % hashlib.sha1(html).hexdigest()[:20])
+    html, etag = _index
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), (etag,)):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=html, headers=headers)
+
+
+def _same(a, b):
+    # Identity, one level deep: the weather section is a fresh dict of job values
+    if a is b:
+        return True
+    return (isinstance(a, dict) and isinstance(b, dict) and a.keys() == b.keys()
+            and all(a[k] is b[k] for k in a))
+
+
+def _encode(payload, version=None, previous=None):
+    # Each top-level section is encoded once and reused while its value is
+    # the same object; the body is their concatenation and the stream
+    # reuses the pieces.
+    sections = {}
+    for k, v in payload.items():
+        if previous is not None and k in previous["values"] and _same(previous["values"][k], v):
+            sections[k] = previous["sections"][k]
+        else:
+            sections[k] = serialize.dumps(v)
+    body = b"{" + b",".join(b'"%s":%s' % (k.encode(), v) for k, v in sections.items()) + b"}"
+    return {
+        "version": version,
+        "values": payload,
+        "sections": sections,
+        "body": body,
+        "etag": '"%s"' % hashlib.sha1(body).hexdigest()[:20],
+        "gzip": None,
+    }
+
+
+def _gzipped(encoded):
+    if encoded["gzip"] is None:
+        encoded["gzip"] = gzip.compress(encoded["body"], compresslevel=6, mtime=0)
+    return encoded["gzip"]
+
+
+def _etag_matches(header, etags):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return bool(tags & set(etags))
+
+
+# Serialized summary per profile for its scheduler's current version; rebuilt
+# only when a provider value changes, so idle polls cost a version check and a 304.
+_encoded = {}
+
+
+async def current_summary(profile=DEFAULT_PROFILE):
+    """Encoded summary for a profile; raises KeyError for unknown profiles."""
+    await _started()
+    cfg = config_service.profile(profile)
+    scheduler = schedulers.get(profile)
+    if scheduler is None or not scheduler.running:
+        return await _build(profile, cfg)
+    version = scheduler.version
+    enc = _encoded.get(profile)
+    if enc is None or enc["version"] != version or not version:
+        enc = _encoded[profile] = await _build(profile, cfg, scheduler, version, enc)
+    return enc
+
+
+async def _build(profile, cfg, scheduler=None, version=None, previous=None):
+    start = time.perf_counter()
+    timings = {}
+    enc = _encode(await build_summary(cfg, scheduler, timings), version, previous)
+    enc["timings"] = timings
+    metrics.summary_seconds.observe(time.perf_counter() - start, profile)
+    return enc
+
+
+def _server_timing(enc, total_s, rebuilt):
+    # Section durations are the provider runs behind this body (the last
+    # background refresh when the scheduler is on)
+    parts = [f'summary;dur={total_s * 1000:.1f};desc="{"build" if rebuilt else "cached"}"']
+    for key, secs in enc.get("timings", {}).items():
+        if secs is not None:
+            parts.append(f"{key};dur={secs * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _unknown_profile(profile):
+    return JSONResponse({"error": f"unknown profile: {profile}"}, status_code=404)
+
+
+@app.get('/v1/summary', response_class=JSONResponse)
+async def summary(request: Request, profile: str = DEFAULT_PROFILE):
+    start = time.perf_counter()
+    before = _encoded.get(profile)
+    try:
+        enc = await current_summary(profile)
+    except KeyError:
+        return _unknown_profile(profile)
+    timing = _server_timing(enc, time.perf_counter() - start, enc is not before)
+    etag = enc["etag"]
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "") and len(enc["body"]) > 1024
+    if use_gzip:
+        etag = etag[:-1] + '-gz"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding", "Server-Timing": timing}
+    if _etag_matches(request.headers.get("if-none-match"), (enc["etag"], etag)):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=_gzipped(enc), media_type="application/json", headers=headers)
+    return Response(content=enc["body"], media_type="application/json", headers=headers)
+
+
+@metrics.collector
+def _cache_metrics():
+    yield "# HELP metro_cache_requests_total Provider cache lookups by key family and result."
+    yield "# TYPE metro_cache_requests_total counter"
+    for fam, counts in sorted(cache.counters.items()):
+        for result, n in sorted(counts.items()):
+            yield metrics.sample("metro_cache_requests_total", n, family=fam, result=result)
+    yield "# HELP metro_cache_entries Entries held by the provider cache."
+    yield "# TYPE metro_cache_entries gauge"
+    yield metrics.sample("metro_cache_entries", cache.stats()["entries"])
+    yield "# HELP metro_breaker_open Whether an upstream's circuit breaker is open (1) or half-open (0.5)."
+    yield "# TYPE metro_breaker_open gauge"
+    for name, b in sorted(breakers.items()):
+        yield metrics.sample("metro_breaker_open", {"closed": 0, "half_open": 0.5, "open": 1}[b.state], upstream=name)
+    yield "# HELP metro_breaker_rejected_total Calls failed fast while the circuit was open."
+    yield "# TYPE metro_breaker_rejected_total counter"
+    for name, b in sorted(breakers.items()):
+        yield metrics.sample("metro_breaker_rejected_total", b.rejected, upstream=name)
+    yield "# HELP metro_budget_used_today WMATA calls spent today by priority."
+    yield "# TYPE metro_budget_used_today gauge"
+    for name, b in budgets.items():
+        for priority, n in sorted(b.by_priority.items()):
+            yield metrics.sample("metro_budget_used_today", n, upstream=name, priority=priority)
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get('/v1/budget', response_class=JSONResponse)
+async def budget():
+    return JSONResponse(content={name: b.snapshot() for name, b in budgets.items()})
+
+
+@app.get('/v1/history', response_class=JSONResponse)
+async def history_query(station: str = None, stop: str = None, dock: str = None,
+                        since: int = None, until: int = None):
+    """Recorded snapshots of one rail station, bus stop or dock, e.g.
+    ``/v1/history?station=A01&since=<epoch>``; each is a change from the one before."""
+    picked = [(kind, ident) for kind, ident in (("rail", station), ("bus", stop), ("bike", dock)) if ident]
+    if len(picked) != 1:
+        return JSONResponse({"error": "give exactly one of station, stop or dock"}, status_code=400)
+    hist = config_service.get().get("history", {})
+    until = int(time.time()) if until is None else until
+    since = until - 3600 if since is None else since
+    name = history.entity(*picked[0])
+    snapshots = await asyncio.to_thread(history.query, hist.get("dir") or store.history_dir(), name, since, until)
+    return JSONResponse({"entity": name, "since": since, "until": until, "snapshots": snapshots})
+
+
+STREAM_PING_S = 15
+
+
+@app.get('/v1/stream')
+async def stream(request: Request, profile: str = DEFAULT_PROFILE):
+    """Server-Sent Events: a ``snapshot`` on connect, then ``delta`` events
+    carrying only the top-level sections that changed."""
+    try:
+        config_service.profile(profile)
+    except KeyError:
+        return _unknown_profile(profile)
+    await _started()
+    scheduler = schedulers.get(profile)
+    if scheduler is None or not scheduler.running:
+        return JSONResponse({"error": "streaming needs the background scheduler"}, status_code=503)
+
+    async def events():
+        sent = None
+        while not await request.is_disconnected():
+            # A config edit may stop this profile's scheduler or remove the
+            # profile: end the stream and let the page fall back to polling
+            scheduler = schedulers.get(profile)
+            if scheduler is None or not scheduler.running:
+                break
+            enc = await current_summary(profile)
+            sections = enc["sections"]
+            if sent is None:
+                yield b"event: snapshot\ndata: " + enc["body"] + b"\n\n"
+            else:
+                changed = [k for k, v in sections.items() if k != "updated_at" and sent.get(k) != v]
+                if changed:
+                    keys = ["updated_at"] + changed
+                    data = b"{" + b",".join(b'"%s":%s' % (k.encode(), sections[k]) for k in keys) + b"}"
+                    yield b"event: delta\ndata: " + data + b"\n\n"
+            sent = sections
+            if not await scheduler.wait_change(enc["version"], STREAM_PING_S):
+                yield b": ping\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
@@ -1,25 +1,19 @@
+import asyncio
+import codecs
+import json
+import re
 import time
-import httpx
-from .util import haversine_m
+from array import array
+from datetime import datetime
+from . import geo, store
+from .cache import cache
+from .models import Dock
+from .upstream import base_url, stream
 
-_cache = {}
 
-
-def _cached(key, ttl_s, loader):
-    now = time.time()
-    entry = _cache.get(key)
-    if entry and now - entry[0] < ttl_s:
-        return entry[1]
-    val = loader()
-    _cache[key] = (now, val)
-    return val
-
-
-def _gbfs_feeds():
-    def load():
-        r = httpx.get("https://gbfs.capitalbikeshare.com/gbfs/gbfs.json", timeout=10)
-        r.raise_for_status()
-        data = r.json().get("data", {})
+async def _gbfs_feeds():
+    def parse(doc):
+        data = doc.get("data", {})
         # Prefer English feeds, then fall back to the first language key
         lang = data.get("en")
         if lang is None and isinstance(data, dict) and data:
@@ -40,81 +34,275 @@ def _gbfs_feeds():
                 if name and url:
                     feeds[name] = url
         return feeds
-    return _cached("gbfs_feeds", 24*3600, load)
 
+    async def load():
+        return await store.fetch_json("gbfs_feeds", "gbfs", f"{base_url('gbfs')}/gbfs/gbfs.json", parse)
+    return await cache.aget("gbfs_feeds", 24*3600, load, max_stale_s=7*24*3600, swr_s=24*3600)
 
-def _station_info():
-    def load():
-        feeds = _gbfs_feeds()
-        url = feeds.get("station_information")
-        if not url:
-            return {}
-        r = httpx.get(url, timeout=10)
-        r.raise_for_status()
+
+async def _station_info():
+    def parse(data):
         info = {}
-        for s in r.json().get("data", {}).get("stations", []):
+        for s in data.get("data", {}).get("stations", []):
             info[str(s.get("station_id"))] = {
                 "name": s.get("name"),
                 "lat": s.get("lat"),
                 "lon": s.get("lon"),
             }
         return info
-    return _cached("gbfs_station_info", 24*3600, load)
+
+    async def load():
+        feeds = await _gbfs_feeds()
+        url = feeds.get("station_information")
+        if not url:
+            return {}
+        return await store.fetch_json("gbfs_station_info", "gbfs", url, parse)
+    return await cache.aget("gbfs_station_info", 24*3600, load, max_stale_s=7*24*3600, swr_s=24*3600)
 
 
-def bike_status(config):
-    # Real GBFS fetch
-    def load():
-        feeds = _gbfs_feeds()
+class _Reader:
+    """Pull-style reader over an async byte stream for the JSON walk below.
+
+    Only the unread tail of the text is kept, so memory stays around one
+    chunk plus the value being decoded.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    async def _more(self):
+        if self.eof:
+            raise ValueError("truncated JSON document")
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            chunk = b""
+        self.buf = self.buf[self.pos:] + self._utf8.decode(chunk, final=self.eof)
+        self.pos = 0
+
+    async def peek(self):
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            await self._more()
+
+    async def expect(self, ch):
+        if await self.peek() != ch:
+            raise ValueError(f"expected {ch!r} at {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    async def skip_comma(self):
+        if await self.peek() == ",":
+            self.pos += 1
+
+    async def value(self):
+        await self.peek()
+        while True:
+            try:
+                v, end = _JSON.raw_decode(self.buf, self.pos)
+                # A value ending at the buffer edge may be a cut-off number
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return v
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            await self._more()
+
+
+_WS = re.compile(r"\s*")
+_JSON = json.JSONDecoder()
+
+
+async def _iter_status(chunks):
+    """Walk a station_status document as it downloads.
+
+    Yields ``(key, value)`` for top-level fields (``last_updated``, ``ttl``,
+    ...) and ``(None, station)`` for each entry of ``data.stations``, without
+    ever holding the whole document.
+    """
+    r = _Reader(chunks)
+    await r.expect("{")
+    while await r.peek() != "}":
+        key = await r.value()
+        await r.expect(":")
+        if key == "data":
+            await r.expect("{")
+            while await r.peek() != "}":
+                sub = await r.value()
+                await r.expect(":")
+                if sub == "stations":
+                    await r.expect("[")
+                    while await r.peek() != "]":
+                        yield None, await r.value()
+                        await r.skip_comma()
+                    r.pos += 1
+                else:
+                    await r.value()
+                await r.skip_comma()
+            r.pos += 1
+        else:
+            yield key, await r.value()
+        await r.skip_comma()
+
+
+def _epoch(value):
+    # GBFS 3 sends RFC 3339 timestamps, earlier versions POSIX seconds
+    if isinstance(value, str):
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+    return int(value or 0)
+
+
+def _ebikes(s):
+    eb = s.get("num_ebikes_available")
+    if eb is None:
+        # GBFS 2.2 vehicle_types_available path
+        for vt in s.get("vehicle_types_available") or []:
+            if (vt.get("vehicle_type_id") or '').lower().find('ebike') != -1:
+                eb = vt.get("count")
+                break
+    return eb or 0
+
+
+class StatusTable:
+    """Live station_status for the whole system, one array slot per station.
+
+    Rows are only rewritten when a station's ``last_reported`` moves forward,
+    and the feed's ``last_updated`` + ``ttl`` say when polling again is useful.
+    """
+
+    def __init__(self):
+        self.rows = {}                  # station_id -> slot, in feed order
+        self.reported = array("q")
+        self.bikes = array("l")
+        self.docks = array("l")
+        self.ebikes = array("l")
+        self.last_updated = 0
+        self.ttl = 0
+        self.fresh_until = 0.0
+        self.applied = 0                # rows rewritten by the last poll
+
+    def __len__(self):
+        return len(self.rows)
+
+    def apply(self, s):
+        sid = str(s.get("station_id"))
+        reported = _epoch(s.get("last_reported"))
+        i = self.rows.get(sid)
+        if i is None:
+            i = self.rows[sid] = len(self.reported)
+            for col in (self.reported, self.bikes, self.docks, self.ebikes):
+                col.append(0)
+        elif reported and reported <= self.reported[i]:
+            return False
+        self.reported[i] = reported
+        self.bikes[i] = int(s.get("num_bikes_available") or 0)
+        self.docks[i] = int(s.get("num_docks_available") or 0)
+        self.ebikes[i] = int(_ebikes(s))
+        return True
+
+    def copy(self):
+        """A table to poll into, leaving this one (a cached value) untouched."""
+        other = StatusTable()
+        other.rows = dict(self.rows)
+        other.reported, other.bikes, other.docks, other.ebikes = (
+            col[:] for col in (self.reported, self.bikes, self.docks, self.ebikes))
+        other.last_updated, other.ttl, other.fresh_until = self.last_updated, self.ttl, self.fresh_until
+        return other
+
+    def get(self, sid):
+        i = self.rows.get(sid)
+        if i is None:
+            return None
+        return {"bikes": self.bikes[i], "docks": self.docks[i], "ebikes": self.ebikes[i]}
+
+    async def ingest(self, chunks):
+        """Apply a streamed station_status document; stops reading early when
+        its ``last_updated`` shows nothing new since the previous poll."""
+        applied = 0
+        updated = ttl = None
+        events = _iter_status(chunks)
+        try:
+            async for key, value in events:
+                if key is None:
+                    applied += self.apply(value)
+                elif key == "last_updated":
+                    updated = _epoch(value)
+                    if updated and updated <= self.last_updated:
+                        break
+                elif key == "ttl":
+                    ttl = int(value or 0)
+        finally:
+            await events.aclose()
+        # Only a fully applied document moves the watermark
+        if updated:
+            self.last_updated = max(self.last_updated, updated)
+        if ttl is not None:
+            self.ttl = ttl
+        self.applied = applied
+        if self.last_updated and self.ttl > 0:
+            self.fresh_until = self.last_updated + self.ttl
+        return applied
+
+
+async def _station_status(ttl_s):
+    # Whole-system status, shared by every profile. Each poll starts from the
+    # cached table (with a shared cache, the newest any worker stored) and
+    # ingests into a copy, so a cached value is never changed in place.
+    async def load():
+        table = cache.peek("gbfs_status")
+        if table is None:
+            table = StatusTable()
+        if time.time() < table.fresh_until:
+            # The feed's own ttl says it can't have changed yet
+            return table
+        feeds = await _gbfs_feeds()
         url = feeds.get("station_status")
         if not url:
-            return []
-        r = httpx.get(url, timeout=10)
-        r.raise_for_status()
-        name_map = _station_info()
-        out = []
-        favs = list(map(str, config.get("bike_share", {}).get("favorites", [])))
-        home = config.get("home", {})
-        lat0 = home.get("lat")
-        lon0 = home.get("lon")
-        radius = float(config.get("bike_share", {}).get("radius_m", 800))
-        candidates = []
-        for s in r.json().get("data", {}).get("stations", []):
-            sid = str(s.get("station_id"))
-            meta = name_map.get(sid) or {}
-            if favs:
-                if sid not in favs:
-                    continue
-                dist = None
-            else:
-                if lat0 is None or lon0 is None or meta.get("lat") is None or meta.get("lon") is None:
-                    continue
-                dist = haversine_m(lat0, lon0, meta.get("lat"), meta.get("lon"))
-                if dist > radius:
-                    continue
-            candidates.append((dist if dist is not None else 1e12, sid, s, meta))
-        candidates.sort(key=lambda x: x[0])
-        if not favs:
-            candidates = candidates[:3]
-        for _, sid, s, meta in candidates:
-            bikes = s.get("num_bikes_available", 0)
-            docks = s.get("num_docks_available", 0)
-            eb = s.get("num_ebikes_available")
-            if eb is None:
-                # GBFS 2.2 vehicle_types_available path
-                vta = s.get("vehicle_types_available") or []
-                for vt in vta:
-                    if (vt.get("vehicle_type_id") or '').lower().find('ebike') != -1:
-                        eb = vt.get("count")
-                        break
-            out.append({
-                "id": sid,
-                "name": (meta.get("name") if meta else f"Station {sid}"),
-                "bikes": bikes,
-                "docks": docks,
-                "ebikes": eb if eb is not None else 0,
-            })
-        return out
-
-    stations = _cached("gbfs_status", int(config.get("bike_share", {}).get("refresh_s", 60)), load)
-    return {"stations": stations}
+            return table
+        table = table.copy()
+        async with stream("gbfs", url) as r:
+            await table.ingest(r.aiter_bytes())
+        return table
+    return await cache.aget("gbfs_status", ttl_s, load)
+
+
+async def bike_status_async(config):
+    # Station info is usually already cached; fetch it alongside status on a cold start
+    ttl = int(config.get("bike_share", {}).get("refresh_s", 60))
+    status, name_map = await asyncio.gather(_station_status(ttl), _station_info())
+    out = []
+    favs = list(map(str, config.get("bike_share", {}).get("favorites", [])))
+    home = config.get("home", {})
+    lat0 = home.get("lat")
+    lon0 = home.get("lon")
+    radius = float(config.get("bike_share", {}).get("radius_m", 800))
+    candidates = []
+    if favs:
+        # Feed order, like the station_status document itself
+        rows = status.rows
+        for sid in sorted((sid for sid in set(favs) if sid in rows), key=rows.get):
+            candidates.append((sid, status.get(sid)))
+    elif lat0 is not None and lon0 is not None:
+        # Nearest docks come from the station_information index; status only needs lookups
+        for _, sid in geo.index_for("gbfs", name_map).within(lat0, lon0, radius):
+            s = status.get(sid)
+            if s is not None:
+                candidates.append((sid, s))
+                if len(candidates) == 3:
+                    break
+    for sid, s in candidates:
+        meta = name_map.get(sid) or {}
+        name = meta.get("name") if meta else f"Station {sid}"
+        out.append(Dock(sid, name, s["bikes"], s["docks"], s["ebikes"]))
+    return {"stations": out}
+
+
+def bike_status(config):
+    return asyncio.run(bike_status_async(config))
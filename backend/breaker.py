@@ -0,0 +1,97 @@
+import logging
+import time
+
+# Upstream hosts, each with its own breaker and pooled client
+UPSTREAMS = ("wmata", "gbfs", "open_meteo", "nws")
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class Breaker:
+    """Circuit breaker for one upstream host.
+
+    ``failures`` failed or slow (over ``slow_s``) calls in a row open it.
+    While open every call fails at once with CircuitOpen, so callers fall
+    back to cached values instead of waiting out a timeout. After
+    ``reset_s`` one background probe is let through (half-open): success
+    closes the circuit, failure keeps it open twice as long, up to
+    ``max_reset_s``.
+    """
+
+    def __init__(self, name, failures=5, reset_s=30.0, max_reset_s=300.0, slow_s=5.0):
+        self.name = name
+        self.configure(failures, reset_s, max_reset_s, slow_s)
+        self.in_row = 0
+        self.opened_at = None
+        self.cooldown_s = self.reset_s
+        self.probing = False
+        self.opened = 0         # times the circuit has opened
+        self.rejected = 0       # calls failed fast while open
+
+    def configure(self, failures=None, reset_s=None, max_reset_s=None, slow_s=None):
+        if failures is not None:
+            self.failures = max(1, int(failures))
+        if reset_s is not None:
+            self.reset_s = float(reset_s)
+        if max_reset_s is not None:
+            self.max_reset_s = float(max_reset_s)
+        if slow_s is not None:
+            self.slow_s = float(slow_s)
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing else "open"
+
+    def reject(self):
+        """Count a call refused while open; True when the caller should send
+        the half-open probe (in the background)."""
+        self.rejected += 1
+        probe = not self.probing and time.monotonic() - self.opened_at >= self.cooldown_s
+        if probe:
+            self.probing = True
+        return probe
+
+    def record(self, ok, elapsed_s=0.0):
+        if ok and elapsed_s <= self.slow_s:
+            if self.opened_at is not None:
+                logging.info("%s circuit closed", self.name)
+            self.in_row = 0
+            self.opened_at = None
+            self.cooldown_s = self.reset_s
+            self.probing = False
+            return
+        self.in_row += 1
+        if self.opened_at is not None:
+            if self.probing:
+                # Half-open probe failed: wait longer before the next one
+                self.cooldown_s = min(self.cooldown_s * 2, max(self.reset_s, self.max_reset_s))
+                self.opened_at = time.monotonic()
+                self.probing = False
+        elif self.in_row >= self.failures:
+            self.opened_at = time.monotonic()
+            self.cooldown_s = self.reset_s
+            self.opened += 1
+            logging.warning("%s circuit open after %d failed or slow calls; probing in %.0fs",
+                            self.name, self.in_row, self.cooldown_s)
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "failures_in_row": self.in_row,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "cooldown_s": self.cooldown_s,
+        }
+
+
+breakers = {}
+
+
+def breaker_for(name):
+    if name not in breakers:
+        breakers[name] = Breaker(name)
+    return breakers[name]
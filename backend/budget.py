@@ -0,0 +1,122 @@
+import asyncio
+import email.utils
+import time
+from collections import Counter
+
+# Lower-priority callers leave part of the bucket for higher ones and have their
+# refresh intervals stretched first when the key is running hot.
+PRIORITIES = ("rail", "meta", "bus", "incidents")
+RESERVE = {"rail": 0.0, "meta": 0.0, "bus": 0.2, "incidents": 0.4}
+STRETCH_WEIGHT = {"rail": 1, "meta": 1, "bus": 2, "incidents": 4}
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def parse_retry_after(value, default=10.0):
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class Budget:
+    """Token bucket plus daily quota shared by every call to one API key.
+
+    WMATA's default tier allows 10 calls/second and 50,000 calls/day.
+    """
+
+    def __init__(self, rate_per_s=10.0, burst=10, daily_quota=50000):
+        self.configure(rate_per_s, burst, daily_quota)
+        self.tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._day = time.gmtime().tm_yday
+        self.used_today = 0
+        self.by_priority = Counter()
+        self.throttled = 0
+        self._blocked_until = 0.0
+        self._last_throttle = 0.0
+
+    def configure(self, rate_per_s=None, burst=None, daily_quota=None):
+        if rate_per_s is not None:
+            self.rate = max(0.1, float(rate_per_s))
+        if burst is not None:
+            self.burst = max(1, int(burst))
+        if daily_quota is not None:
+            self.daily_quota = int(daily_quota)
+
+    def _refill(self, now):
+        self.tokens = min(float(self.burst), self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        day = time.gmtime().tm_yday
+        if day != self._day:
+            self._day = day
+            self.used_today = 0
+            self.by_priority.clear()
+
+    async def acquire(self, priority="bus"):
+        reserve = self.burst * RESERVE.get(priority, RESERVE["bus"])
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            if self.daily_quota and self.used_today >= self.daily_quota:
+                raise BudgetExceeded("WMATA daily call quota reached")
+            if self.tokens - 1 >= reserve:
+                self.tokens -= 1
+                self.used_today += 1
+                self.by_priority[priority] += 1
+                return
+            await asyncio.sleep((reserve + 1 - self.tokens) / self.rate)
+
+    def throttle(self, retry_after_s):
+        """The upstream said 429 / Retry-After: hold every caller until then."""
+        now = time.monotonic()
+        self.throttled += 1
+        self._last_throttle = now
+        self._blocked_until = max(self._blocked_until, now + retry_after_s)
+        self.tokens = 0.0
+
+    def pressure(self):
+        """0 when comfortably inside the quota; grows as the key runs hot."""
+        p = 0.0
+        if self.daily_quota:
+            t = time.gmtime()
+            elapsed = max(600.0, t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec)
+            projected = self.used_today * 86400.0 / elapsed
+            p = max(0.0, projected / self.daily_quota - 0.7) / 0.3
+        if self._last_throttle and time.monotonic() - self._last_throttle < 300:
+            p += 1.0
+        return min(p, 3.0)
+
+    def stretch(self, priority):
+        """Multiplier for a refresh interval of this priority."""
+        return 1.0 + self.pressure() * STRETCH_WEIGHT.get(priority, STRETCH_WEIGHT["bus"])
+
+    def snapshot(self):
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "daily_quota": self.daily_quota,
+            "used_today": self.used_today,
+            "by_priority": dict(self.by_priority),
+            "throttled": self.throttled,
+            "blocked_for_s": round(max(0.0, self._blocked_until - now), 1),
+            "pressure": round(self.pressure(), 3),
+            "stretch": {p: round(self.stretch(p), 2) for p in PRIORITIES},
+        }
+
+
+budgets = {"wmata": Budget()}
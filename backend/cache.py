@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from . import metrics
+from .shared import SharedStore
+
+# How often a worker waiting on another worker's load checks for its result
+SHARED_POLL_S = 0.05
+
+
+def family(key):
+    """Key family used for stats: ``rail_A01`` -> ``rail``."""
+    return key.split("_", 1)[0]
+
+
+class Cache:
+    """Bounded TTL cache shared by all providers.
+
+    - single-flight: concurrent misses for a key share one loader call
+    - stale-while-revalidate: within ``swr_s`` after expiry the old value is
+      returned at once and refreshed in the background
+    - stale-if-error: a failed load serves the last good value for up to
+      ``max_stale_s`` past its TTL
+    - LRU eviction beyond ``max_entries``
+    - optionally backed by a SharedStore, so uvicorn workers on one host
+      share entries and only one of them refreshes a key at a time
+
+    ``get`` is for sync loaders, ``aget`` for coroutine loaders.
+    """
+
+    def __init__(self, max_entries=512, max_stale_s=900):
+        self.max_entries = max_entries
+        self.max_stale_s = max_stale_s
+        self._entries = OrderedDict()   # key -> (fetched_at, value)
+        self._inflight = {}             # key -> (loop, task)
+        self._locks = defaultdict(threading.Lock)
+        self._mutex = threading.Lock()
+        self.shared = None
+        self.counters = defaultdict(lambda: {"hit": 0, "miss": 0, "stale": 0, "error": 0, "evict": 0, "shared": 0})
+
+    def configure(self, max_entries=None, max_stale_s=None, shared=None):
+        """``shared`` is a SQLite path for the cross-worker store, or False to
+        keep entries in this process only."""
+        if max_entries is not None:
+            self.max_entries = int(max_entries)
+        if max_stale_s is not None:
+            self.max_stale_s = float(max_stale_s)
+        if shared is not None:
+            if not shared:
+                self.shared = None
+            elif self.shared is None or self.shared.path != shared:
+                self.shared = SharedStore(shared)
+        with self._mutex:
+            self._evict()
+
+    def _count(self, key, what):
+        self.counters[family(key)][what] += 1
+
+    def _lookup(self, key):
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, fetched_at=None):
+        with self._mutex:
+            self._entries[key] = (fetched_at if fetched_at is not None else time.time(), value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            old, _ = self._entries.popitem(last=False)
+            self._count(old, "evict")
+
+    def _fallback(self, key, entry, ttl_s, max_stale_s, err):
+        limit = self.max_stale_s if max_stale_s is None else max_stale_s
+        if entry is not None and time.time() - entry[0] < ttl_s + limit:
+            self._count(key, "stale")
+            logging.warning("cache %s: load failed (%s); serving value from %ds ago",
+                            key, err, int(time.time() - entry[0]))
+            return entry[1]
+        self._count(key, "error")
+        raise err
+
+    def _shared_entry(self, key, entry):
+        """The shared store's entry for ``key`` if it is newer than ``entry``
+        (adopting it locally), else ``entry``."""
+        other = self.shared.get(key)
+        if other is not None and (entry is None or other[0] > entry[0]):
+            self._store(key, other[1], other[0])
+            return other
+        return entry
+
+    def peek(self, key):
+        entry = self._lookup(key)
+        return entry[1] if entry else None
+
+    def put(self, key, value, fetched_at=None):
+        self._store(key, value, fetched_at)
+
+    async def aput(self, key, value):
+        """Store a value just fetched, publishing it to the shared store too,
+        so other workers use it instead of fetching it again."""
+        fetched_at = time.time()
+        self._store(key, value, fetched_at)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.put, key, value, fetched_at)
+
+    def invalidate(self, key=None, prefix=None):
+        if self.shared is not None:
+            self.shared.delete(key, prefix)
+        with self._mutex:
+            if key is None and prefix is None:
+                self._entries.clear()
+                return
+            for k in list(self._entries):
+                if k == key or (prefix is not None and k.startswith(prefix)):
+                    del self._entries[k]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "shared": self.shared.path if self.shared is not None else None,
+            "families": {k: dict(v) for k, v in self.counters.items()},
+        }
+
+    def get(self, key, ttl_s, loader, max_stale_s=None):
+        entry = self._lookup(key)
+        if entry and time.time() - entry[0] < ttl_s:
+            self._count(key, "hit")
+            return entry[1]
+        with self._locks[key]:
+            # Another thread may have loaded it while we waited on the lock
+            entry = self._lookup(key)
+            if entry and time.time() - entry[0] < ttl_s:
+                self._count(key, "hit")
+                return entry[1]
+            if self.shared is not None:
+                entry = self._shared_entry(key, entry)
+                if entry and time.time() - entry[0] < ttl_s:
+                    self._count(key, "shared")
+                    return entry[1]
+            self._count(key, "miss")
+            start = time.perf_counter()
+            try:
+                val = loader()
+            except Exception as e:
+                return self._fallback(key, entry, ttl_s, max_stale_s, e)
+            finally:
+                metrics.loader_seconds.observe(time.perf_counter() - start, family(key))
+            fetched_at = time.time()
+            self._store(key, val, fetched_at)
+            if self.shared is not None:
+                self.shared.put(key, val, fetched_at)
+            return val
+
+    async def aget(self, key, ttl_s, loader, max_stale_s=None, swr_s=0):
+        entry = self._lookup(key)
+        now = time.time()
+        if entry and now - entry[0] < ttl_s:
+            self._count(key, "hit")
+            return entry[1]
+        if self.shared is not None:
+            # Another worker may have refreshed it already
+            entry = await asyncio.to_thread(self._shared_entry, key, entry)
+            now = time.time()
+            if entry and now - entry[0] < ttl_s:
+                self._count(key, "shared")
+                return entry[1]
+        task = self._task(key, ttl_s, loader)
+        if entry and now - entry[0] < ttl_s + swr_s:
+            self._count(key, "stale")
+            return entry[1]
+        self._count(key, "miss")
+        try:
+            # shield: a caller timing out must not cancel the shared load
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return self._fallback(key, entry, ttl_s, max_stale_s, e)
+
+    def _task(self, key, ttl_s, loader):
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(key)
+        if inflight and inflight[0] is loop and not inflight[1].done():
+            return inflight[1]
+
+        async def run():
+            start = time.perf_counter()
+            try:
+                if self.shared is not None:
+                    return await self._load_shared(key, ttl_s, loader)
+                val = await loader()
+                self._store(key, val)
+                return val
+            finally:
+                metrics.loader_seconds.observe(time.perf_counter() - start, family(key))
+                if self._inflight.get(key, (None, None))[1] is task:
+                    del self._inflight[key]
+
+        task = loop.create_task(run())
+        # Background revalidations may finish with nobody awaiting them
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = (loop, task)
+        return task
+
+    async def _load_shared(self, key, ttl_s, loader):
+        """Cross-process single-flight: load under the key's lease and publish
+        the result, or wait for the worker holding the lease to publish it."""
+        shared = self.shared
+        while True:
+            if await asyncio.to_thread(shared.acquire, key):
+                try:
+                    val = await loader()
+                    fetched_at = time.time()
+                    self._store(key, val, fetched_at)
+                    await asyncio.to_thread(shared.put, key, val, fetched_at)
+                    return val
+                finally:
+                    await asyncio.to_thread(shared.release, key)
+            await asyncio.sleep(SHARED_POLL_S)
+            entry = await asyncio.to_thread(shared.get, key)
+            if entry is not None and time.time() - entry[0] < ttl_s:
+                self._store(key, entry[1], entry[0])
+                self._count(key, "shared")
+                return entry[1]
+
+
+cache = Cache()
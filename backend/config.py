@@ -1,10 +1,17 @@
+import copy
+import logging
 import os
+import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+from zoneinfo import ZoneInfo
 import yaml
 
 
 DEFAULT_CONFIG = {
     "home": {"lat": 38.8895, "lon": -77.0353, "radius_m": 1200},
-    "rail": {"favorites": [], "lines": ["RD","BL","OR","SV","YL","GR"], "refresh_s": 15, "max_stations": 5},
+    "rail": {"favorites": [], "lines": ["RD","BL","OR","SV","YL","GR"], "refresh_s": 15, "max_stations": 5, "max_per_direction": 3, "timeout_s": 8, "hedge": False},
     "bus": {
         "favorites": [],
         "extra_stops": [],              # Always include these StopIDs
@@ -15,29 +22,195 @@ DEFAULT_CONFIG = {
         "refresh_s": 20,
         "max_stops": 3,
         "max_arrivals": 8,
+        "max_concurrency": 10,          # Parallel jPredictions calls per refresh
+        "timeout_s": 8,
     },
-    "bike_share": {"enabled": True, "radius_m": 800, "favorites": [], "refresh_s": 45},
-    "weather": {"provider": "open-meteo", "refresh_s": 600},
+    "bike_share": {"enabled": True, "radius_m": 800, "favorites": [], "refresh_s": 45, "timeout_s": 8},
+    "weather": {"provider": "open-meteo", "refresh_s": 600, "forecast_days": 7, "timeout_s": 8},
     "ui": {"layout": "combined", "rotate_ms": 0},
+    "profiles": {},                      # name -> per-display overrides (home, rail, bus, ...)
+    "data_dir": "data",
+    "cache": {"max_entries": 512, "max_stale_s": 900, "shared": False},
+    "budget": {"wmata": {"rate_per_s": 10, "burst": 10, "daily_quota": 50000}},
+    "scheduler": {"enabled": True, "jitter": 0.1, "max_backoff_s": 300},
+    # Scales rail/bus/incident refresh_s from the last payload (backend/policy.py);
+    # rail_hours overrides Metrorail's opening hours, Monday first
+    "adaptive": {"enabled": True, "near_min": 3, "near_factor": 0.5, "far_min": 15, "far_factor": 2,
+                 "empty_factor": 4, "closed_factor": 8, "min_s": 5, "max_s": 300, "tz": "America/New_York"},
+    # Append rail/bus/bike snapshots from these profiles to data_dir/history (or dir)
+    "history": {"enabled": False, "dir": None, "keep_days": 60, "profiles": ["default"]},
+    "breaker": {"failures": 5, "reset_s": 30, "max_reset_s": 300, "slow_s": 5},
+    "http": {"http2": True, "max_connections_per_host": 10, "keepalive_s": 60, "timeout_s": 10},
 }
 
 
+DEFAULT_PROFILE = "default"
+
+
+def _merge(base, overrides):
+    # merge recursively so nested sections keep defaults the user didn't set
+    cfg = dict(base)
+    for k, v in (overrides or {}).items():
+        if isinstance(v, Mapping) and isinstance(cfg.get(k), Mapping):
+            cfg[k] = _merge(cfg[k], v)
+        else:
+            cfg[k] = v
+    return cfg
+
+
 def load_config(path: str = "config.yaml") -> dict:
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
             data = yaml.safe_load(f) or {}
     else:
         data = {}
-    # merge shallowly with defaults
-    cfg = DEFAULT_CONFIG.copy()
-    for k, v in (data or {}).items():
-        if isinstance(v, dict) and isinstance(cfg.get(k), dict):
-            merged = cfg[k].copy()
-            merged.update(v)
-            cfg[k] = merged
-        else:
-            cfg[k] = v
-    return cfg
+    # deepcopy so callers never share (or mutate) the default lists
+    return _merge(copy.deepcopy(DEFAULT_CONFIG), copy.deepcopy(data))
+
+
+def profile_names(cfg) -> list:
+    return [DEFAULT_PROFILE] + [n for n in (cfg.get("profiles") or {}) if n != DEFAULT_PROFILE]
+
+
+def profile_config(cfg, name: str = DEFAULT_PROFILE):
+    """Config for a named display profile: the base config with the profile's
+    sections (home, rail, bus, ...) merged over it. Raises KeyError if unknown."""
+    if name == DEFAULT_PROFILE:
+        return cfg
+    profiles = cfg.get("profiles") or {}
+    if name not in profiles:
+        raise KeyError(name)
+    return _merge(cfg, profiles[name] or {})
+
+
+_NUMBERS = {
+    "home": ("lat", "lon", "radius_m"),
+    "rail": ("refresh_s", "max_stations", "max_per_direction", "timeout_s"),
+    "bus": ("refresh_s", "max_stops", "max_arrivals", "max_concurrency", "timeout_s",
+            "include_near_radius_m", "include_near_max_stops"),
+    "bike_share": ("refresh_s", "radius_m", "timeout_s"),
+    "weather": ("refresh_s", "forecast_days", "timeout_s"),
+    "adaptive": ("near_min", "near_factor", "far_min", "far_factor", "empty_factor", "closed_factor",
+                 "min_s", "max_s"),
+    "history": ("keep_days",),
+}
+_LISTS = {
+    "rail": ("favorites", "lines"),
+    "bus": ("favorites", "extra_stops", "include_near_stations", "routes"),
+    "bike_share": ("favorites",),
+    "adaptive": ("rail_hours",),
+    "history": ("profiles",),
+}
+
+
+def validate(cfg) -> None:
+    """Raise ValueError for settings that would break providers at refresh time."""
+    for name in profile_names(cfg):
+        pc = profile_config(cfg, name)
+        where = "" if name == DEFAULT_PROFILE else f"profiles.{name}."
+        for section, keys in _NUMBERS.items():
+            if not isinstance(pc.get(section), Mapping):
+                raise ValueError(f"{where}{section} must be a mapping")
+            for key in keys:
+                v = pc[section].get(key)
+                if v is not None and (isinstance(v, bool) or not isinstance(v, (int, float))):
+                    raise ValueError(f"{where}{section}.{key} must be a number, got {v!r}")
+                if key.endswith("_s") and v is not None and v <= 0:
+                    raise ValueError(f"{where}{section}.{key} must be positive")
+        for section, keys in _LISTS.items():
+            for key in keys:
+                v = pc[section].get(key)
+                if v is not None and not isinstance(v, (list, tuple)):
+                    raise ValueError(f"{where}{section}.{key} must be a list")
+        tz = pc["adaptive"].get("tz")
+        if tz is not None:
+            try:
+                ZoneInfo(tz)
+            except (TypeError, ValueError, LookupError) as e:
+                raise ValueError(f"{where}adaptive.tz: unknown time zone {tz!r}") from e
+
+
+def freeze(value):
+    """Read-only view of a config tree: mappings become mappingproxy, lists tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def changed_sections(old, new) -> set:
+    """Top-level keys whose values differ between two configs."""
+    return {k for k in set(old) | set(new) if old.get(k) != new.get(k)}
+
+
+class ConfigService:
+    """Parses config.yaml once and swaps in a new validated, frozen snapshot
+    when the file's mtime changes (checked at most every ``check_interval_s``).
+
+    Listeners are called as ``fn(old, new)`` after a swap. An invalid edit is
+    logged and the previous snapshot stays in effect.
+    """
+
+    def __init__(self, path: str = "config.yaml", check_interval_s: float = 2.0):
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self._snapshot = None
+        self._mtime = None
+        self._checked = 0.0
+        self._profiles = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self):
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked < self.check_interval_s:
+            return self._snapshot
+        with self._lock:
+            self._checked = now
+            mtime = self._stat()
+            if self._snapshot is not None and mtime == self._mtime:
+                return self._snapshot
+            try:
+                cfg = load_config(self.path)
+                validate(cfg)
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                if self._snapshot is None:
+                    raise
+                logging.error("config %s not reloaded: %s", self.path, e)
+                self._mtime = mtime
+                return self._snapshot
+            old, self._snapshot = self._snapshot, freeze(cfg)
+            self._mtime = mtime
+            self._profiles = {}
+        if old is not None:
+            logging.info("config %s reloaded", self.path)
+            for fn in self._listeners:
+                try:
+                    fn(old, self._snapshot)
+                except Exception:
+                    logging.exception("config listener failed")
+        return self._snapshot
+
+    def profile(self, name: str = DEFAULT_PROFILE):
+        """Frozen profile config for the current snapshot (merged once per snapshot)."""
+        cfg = self.get()
+        pc = self._profiles.get(name)
+        if pc is None or pc[0] is not cfg:
+            pc = self._profiles[name] = (cfg, freeze(profile_config(cfg, name)))
+        return pc[1]
+
+
+config_service = ConfigService()
 
 
 # Mock mode has been removed to avoid false positives.
@@ -0,0 +1,141 @@
+import heapq
+import math
+from array import array
+from .util import haversine_m
+
+R = 6371000.0
+
+# Rings searched around a point before falling back to a linear scan
+MAX_RING = 32
+
+
+class GeoIndex:
+    """Grid-bucket index over points projected to local planar metres.
+
+    Points are projected once (equirectangular about their mean latitude) and
+    bucketed into ``cell_m`` squares, so radius and k-nearest queries only
+    compare squared planar distances for nearby cells. Reported distances are
+    exact haversine metres for the returned points.
+    """
+
+    def __init__(self, points, cell_m=500.0):
+        keys, lats, lons = [], [], []
+        for key, lat, lon in points:
+            if lat is None or lon is None:
+                continue
+            keys.append(key)
+            lats.append(float(lat))
+            lons.append(float(lon))
+        self.keys = keys
+        self.lats = array("d", lats)
+        self.lons = array("d", lons)
+        self.cell_m = float(cell_m)
+        self._kx = R * math.radians(1) * math.cos(math.radians(sum(lats) / len(lats) if lats else 0.0))
+        self._ky = R * math.radians(1)
+        self.xs = array("d", (lon * self._kx for lon in lons))
+        self.ys = array("d", (lat * self._ky for lat in lats))
+        self.cells = {}
+        for i in range(len(keys)):
+            self.cells.setdefault(self._cell(self.xs[i], self.ys[i]), []).append(i)
+        if self.cells:
+            cxs = [c[0] for c in self.cells]
+            cys = [c[1] for c in self.cells]
+            self._bounds = (min(cxs), max(cxs), min(cys), max(cys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _cell(self, x, y):
+        return (int(x // self.cell_m), int(y // self.cell_m))
+
+    def _exact(self, lat, lon, idxs):
+        out = [(haversine_m(lat, lon, self.lats[i], self.lons[i]), self.keys[i]) for i in idxs]
+        out.sort(key=lambda x: x[0])
+        return out
+
+    def within(self, lat, lon, radius_m):
+        """All points within ``radius_m``, nearest first, as ``(dist_m, key)``."""
+        if not self.cells:
+            return []
+        x, y = lon * self._kx, lat * self._ky
+        # Small margin for projection error; exact distances filter below
+        r = radius_m * 1.01 + 1.0
+        r2 = r * r
+        cx0, cy0 = self._cell(x - r, y - r)
+        cx1, cy1 = self._cell(x + r, y + r)
+        xs, ys, cells = self.xs, self.ys, self.cells
+        hits = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for i in cells.get((cx, cy), ()):
+                    dx = xs[i] - x
+                    dy = ys[i] - y
+                    if dx * dx + dy * dy <= r2:
+                        hits.append(i)
+        return [h for h in self._exact(lat, lon, hits) if h[0] <= radius_m]
+
+    def _ring(self, cx, cy, ring):
+        """Cells on the border of the square ``ring`` cells out from (cx, cy)."""
+        if ring == 0:
+            yield cx, cy
+            return
+        for gx in range(cx - ring, cx + ring + 1):
+            yield gx, cy - ring
+            yield gx, cy + ring
+        for gy in range(cy - ring + 1, cy + ring):
+            yield cx - ring, gy
+            yield cx + ring, gy
+
+    def _linear(self, lat, lon, k):
+        # Far from the data the planar projection no longer ranks points
+        # correctly, so this pass compares haversine distances
+        lats, lons, keys = self.lats, self.lons, self.keys
+        return heapq.nsmallest(k, ((haversine_m(lat, lon, lats[i], lons[i]), keys[i]) for i in range(len(keys))),
+                               key=lambda h: h[0])
+
+    def nearest(self, lat, lon, k):
+        """The ``k`` nearest points regardless of distance, as ``(dist_m, key)``."""
+        if not self.cells or k <= 0:
+            return []
+        x, y = lon * self._kx, lat * self._ky
+        cx, cy = self._cell(x, y)
+        bx0, bx1, by0, by1 = self._bounds
+        if not (bx0 <= cx <= bx1 and by0 <= cy <= by1):
+            # Far outside the data every ring up to it is empty
+            return self._linear(lat, lon, k)
+        # Past this ring the square covers every populated cell
+        last = max(cx - bx0, bx1 - cx, cy - by0, by1 - cy)
+        xs, ys, cells = self.xs, self.ys, self.cells
+        found = []  # (planar d2, idx)
+        for ring in range(min(last, MAX_RING) + 1):
+            for cell in self._ring(cx, cy, ring):
+                for i in cells.get(cell, ()):
+                    dx = xs[i] - x
+                    dy = ys[i] - y
+                    found.append((dx * dx + dy * dy, i))
+            # Everything closer than ring * cell_m has been seen by now
+            if len(found) >= k:
+                found.sort()
+                reach = ring * self.cell_m
+                if found[k - 1][0] <= reach * reach:
+                    break
+        else:
+            if last > MAX_RING:
+                # Sparse data around the point: one pass beats more rings
+                return self._linear(lat, lon, k)
+        found.sort()
+        # Pad a little so projection error can't drop a true neighbour
+        return self._exact(lat, lon, [i for _, i in found[:k + 2]])[:k]
+
+
+_indexes = {}
+
+
+def index_for(name, meta, cell_m=500.0):
+    """Build (once per metadata object) an index over ``{key: {"lat", "lon"}}``."""
+    cached = _indexes.get(name)
+    if cached is not None and cached[0] is meta:
+        return cached[1]
+    idx = GeoIndex(((k, m.get("lat"), m.get("lon")) for k, m in meta.items()), cell_m=cell_m)
+    _indexes[name] = (meta, idx)
+    return idx
@@ -0,0 +1,316 @@
+import bisect
+import calendar
+import heapq
+import io
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import defaultdict
+
+# One fixed-width row per train, bus arrival or dock reading:
+# t (epoch s), entity and label (ids into the day's strings), a/b/c, flags.
+# Rail: a=minutes, b=cars. Bus: a=minutes. Bike: a=bikes, b=docks, c=ebikes.
+ROW = struct.Struct("<IHHhhhBx")
+EMPTY = 1           # flags: the entity had no rows at t
+KINDS = ("rail", "bus", "bike")
+MINUTES = {"ARR": -1, "BRD": -2}
+UNKNOWN = -3        # any other non-numeric minutes ("--")
+_DECODE = {-1: "ARR", -2: "BRD", UNKNOWN: "--"}
+
+
+def _i16(v):
+    try:
+        return max(-32768, min(32767, int(v)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _minutes(m):
+    return MINUTES.get(m, UNKNOWN) if not isinstance(m, int) else _i16(m)
+
+
+def entity(kind, ident):
+    return f"{kind}:{ident}"
+
+
+def snapshot(kind, value):
+    """``[(entity, rows)]`` for a rail, bus or bike provider value; a row is
+    ``(label, a, b, c)``."""
+    out = []
+    if kind == "rail":
+        for st in value.get("stations", []):
+            rows = [(f"{t.line}|{t.dest}|{t.group}", _minutes(t.minutes), _i16(t.cars), 0) for t in st.arrivals]
+            out.append((entity(kind, st.code), rows))
+    elif kind == "bus":
+        for stop in value.get("stops", []):
+            rows = [(f"{a.route}|{a.headsign}", _minutes(a.minutes), 0, 0) for a in stop.arrivals]
+            out.append((entity(kind, stop.id), rows))
+    elif kind == "bike":
+        for d in value.get("stations", []):
+            out.append((entity(kind, d.id), [("", _i16(d.bikes), _i16(d.docks), _i16(d.ebikes))]))
+    return out
+
+
+def _day(t):
+    return time.strftime("%Y-%m-%d", time.gmtime(t))
+
+
+class Recorder:
+    """Appends rail, bus and bike snapshots to daily fixed-width logs.
+
+    ``record`` only queues the snapshot; a writer thread appends it, so a
+    slow SD card never holds up a refresh (a full queue drops snapshots and
+    counts them). Per entity, only snapshots that differ from the last one
+    written that day are stored, and each day starts with full snapshots,
+    so a day's files stand alone. Days older than ``keep_days`` are deleted.
+
+    Each process writes its own ``{day}.{pid}.rows`` / ``.strings`` pair, so
+    uvicorn workers never share string ids; ``scan`` merges them.
+    """
+
+    def __init__(self, max_pending=1000):
+        self.dir = None
+        self.keep_days = 60
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._current = None    # day, rows file, strings file, string ids, last rows per entity
+
+    def configure(self, enabled=False, dir=None, keep_days=None, **_):
+        if keep_days is not None:
+            self.keep_days = int(keep_days)
+        self.dir = dir if enabled and dir else None
+        if self.dir is not None and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name="history", daemon=True)
+            self._thread.start()
+
+    def record(self, kind, value, t=None):
+        if self.dir is None or kind not in KINDS or not value:
+            return
+        try:
+            self._queue.put_nowait((int(t or time.time()), snapshot(kind, value)))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout_s=5.0):
+        """Write what is queued and stop the writer."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout_s)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except OSError as e:
+                logging.warning("history: write failed: %s", e)
+                self._rotate(None)
+        self._rotate(None)
+
+    def _rotate(self, day):
+        if self._current is not None:
+            self._current[1].close()
+            self._current[2].close()
+            self._current = None
+        if day is None or self.dir is None:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        stem = f"{day}.{os.getpid()}"
+        ids = {s: i for i, s in enumerate(read_strings(self.dir, stem))}
+        rows = open(os.path.join(self.dir, f"{stem}.rows"), "ab")
+        # A partial row from a crash would misalign everything after it
+        rows.truncate(rows.tell() - rows.tell() % ROW.size)
+        strings = open(os.path.join(self.dir, f"{stem}.strings"), "ab+")
+        # Likewise a partial string: the next one would be appended onto it
+        strings.seek(0)
+        strings.truncate(strings.read().rfind(b"\n") + 1)
+        strings = io.TextIOWrapper(strings, encoding="utf-8")
+        self._current = (day, rows, strings, ids, {})
+        self._prune(day)
+
+    def _prune(self, today):
+        cutoff = _day(calendar.timegm(time.strptime(today, "%Y-%m-%d")) - self.keep_days * 86400)
+        for name in os.listdir(self.dir):
+            if name.endswith((".rows", ".strings")) and name.split(".", 1)[0] < cutoff:
+                os.remove(os.path.join(self.dir, name))
+
+    def _id(self, s):
+        _, _, strings, ids, _ = self._current
+        i = ids.get(s)
+        if i is None:
+            if len(ids) > 0xFFFF:
+                raise OSError("too many distinct strings for one day")
+            i = ids[s] = len(ids)
+            strings.write(json.dumps(s) + "\n")
+        return i
+
+    def _write(self, t, entities):
+        if self.dir is None:
+            # Disabled by a config reload while snapshots were still queued
+            return
+        day = _day(t)
+        if self._current is None or self._current[0] != day:
+            self._rotate(day)
+        _, rows_f, strings_f, _, last = self._current
+        out = []
+        for name, rows in entities:
+            if last.get(name) == rows:
+                continue
+            last[name] = rows
+            e = self._id(name)
+            if not rows:
+                out.append(ROW.pack(t, e, 0, 0, 0, 0, EMPTY))
+            for label, a, b, c in rows:
+                out.append(ROW.pack(t, e, self._id(label), a, b, c, 0))
+        if out:
+            # Strings first, so every id in the rows file resolves
+            strings_f.flush()
+            rows_f.write(b"".join(out))
+            rows_f.flush()
+            self.written += len(out)
+
+
+recorder = Recorder()
+
+
+def read_strings(path, stem):
+    try:
+        with open(os.path.join(path, f"{stem}.strings"), "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.endswith("\n")]
+    except FileNotFoundError:
+        return []
+
+
+def _stems(path):
+    """``{day: [file stems]}`` for every rows file, one stem per writer."""
+    try:
+        names = os.listdir(path)
+    except FileNotFoundError:
+        return {}
+    out = defaultdict(list)
+    for n in sorted(names):
+        if n.endswith(".rows"):
+            out[n.split(".", 1)[0]].append(n[:-5])
+    return out
+
+
+def days(path, since, until):
+    """Recorded days overlapping ``[since, until]``, oldest first."""
+    first, last = _day(since), _day(until)
+    return sorted(d for d in _stems(path) if first <= d <= last)
+
+
+def _first_at(mm, n, t):
+    # Rows are appended in time order: binary search the first one at or after t
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ROW.unpack_from(mm, mid * ROW.size)[0] < t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _scan_file(path, stem, since, until, entities):
+    strings = read_strings(path, stem)
+    ids = {s: i for i, s in enumerate(strings)}
+    wanted = None if entities is None else {ids[e] for e in entities if e in ids}
+    if wanted is not None and not wanted:
+        return
+    with open(os.path.join(path, f"{stem}.rows"), "rb") as f:
+        n = os.fstat(f.fileno()).st_size // ROW.size
+        if not n:
+            return
+        with mmap.mmap(f.fileno(), n * ROW.size, access=mmap.ACCESS_READ) as mm:
+            start, end = _first_at(mm, n, since), _first_at(mm, n, until + 1)
+            group = None
+            view = memoryview(mm)[start * ROW.size:end * ROW.size]
+            try:
+                for t, e, label, a, b, c, flags in ROW.iter_unpack(view):
+                    if wanted is not None and e not in wanted:
+                        continue
+                    if group is None or group[0] != t or group[1] != e:
+                        if group is not None:
+                            yield group[0], strings[group[1]], group[2]
+                        group = (t, e, [])
+                    if not flags & EMPTY:
+                        group[2].append((strings[label], a, b, c))
+                if group is not None:
+                    yield group[0], strings[group[1]], group[2]
+            finally:
+                view.release()
+
+
+def scan(path, since, until, entities=None):
+    """Yield ``(t, entity, rows)`` snapshots recorded in ``[since, until]``,
+    in time order, optionally only for the named entities. Files are memory
+    mapped and binary searched by time, so only the requested range is read.
+    The writers of a day are merged by time; a snapshot equal to the
+    entity's previous one (another worker saw the same data) is skipped."""
+    stems = _stems(path)
+    for day in days(path, since, until):
+        files = [_scan_file(path, stem, since, until, entities) for stem in stems[day]]
+        last = {}
+        for t, name, rows in heapq.merge(*files, key=lambda snap: snap[0]):
+            if last.get(name) == rows:
+                continue
+            last[name] = rows
+            yield t, name, rows
+
+
+def decode(name, rows):
+    """Rows of one snapshot as the JSON the board uses for that kind."""
+    kind = name.split(":", 1)[0]
+    if kind == "bike":
+        return {"bikes": rows[0][1], "docks": rows[0][2], "ebikes": rows[0][3]} if rows else {}
+    out = []
+    for label, a, b, _ in rows:
+        parts = label.split("|")
+        minutes = _DECODE.get(a, a)
+        if kind == "rail":
+            out.append({"line": parts[0], "dest": parts[1], "minutes": minutes, "cars": b, "group": parts[2]})
+        else:
+            out.append({"route": parts[0], "headsign": parts[1], "minutes": minutes})
+    return {"arrivals": out}
+
+
+def query(path, name, since, until):
+    """``[{"t": ..., **decoded}]`` for one entity, e.g. ``rail:A01``."""
+    return [dict(decode(name, rows), t=t) for t, _, rows in scan(path, since, until, [name])]
+
+
+class Timeline:
+    """Recorded state over time for replaying a log against the app: every
+    entity's snapshot as of a given moment."""
+
+    def __init__(self, path, since, until):
+        self.times = defaultdict(list)      # entity -> [t], ascending
+        self.rows = defaultdict(list)       # entity -> [rows], parallel to times
+        for t, name, rows in scan(path, since, until):
+            self.times[name].append(t)
+            self.rows[name].append(rows)
+        self.start = min((ts[0] for ts in self.times.values()), default=since)
+        self.end = max((ts[-1] for ts in self.times.values()), default=until)
+
+    def at(self, t, kind=None):
+        """``{entity: rows}`` as of ``t``."""
+        out = {}
+        for name, times in self.times.items():
+            if kind is not None and not name.startswith(kind + ":"):
+                continue
+            i = bisect.bisect_right(times, t)
+            if i:
+                out[name] = self.rows[name][i - 1]
+        return out
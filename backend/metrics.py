@@ -0,0 +1,127 @@
+import re
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# Seconds; spans a warm cache hit up to a provider timing out
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []
+_lock = threading.Lock()
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = defaultdict(int)
+        _registry.append(self)
+
+    def inc(self, *labels, n=1):
+        with _lock:
+            self.values[labels] += n
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, v in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_num(v)}"
+
+
+class Gauge(Counter):
+    def dec(self, *labels):
+        self.inc(*labels, n=-1)
+
+    def lines(self):
+        for line in super().lines():
+            yield line.replace(" counter", " gauge") if line.startswith("# TYPE") else line
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}    # labels -> [bucket counts..., count, sum]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with _lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += 1
+            s[-1] += value
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for key, s in sorted(self.series.items()):
+            for b, n in zip(self.buckets, s):
+                yield f"{self.name}_bucket{_labels(names, key + (b,))} {n}"
+            yield f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {s[-2]}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {s[-2]}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_num(s[-1])}"
+
+
+def sample(name, value, **labels):
+    """One exposition line, for collectors."""
+    return f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_num(value)}"
+
+
+def collector(fn):
+    """Register ``fn() -> iterable of lines`` for values computed at scrape time."""
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """Everything in Prometheus text exposition format (0.0.4)."""
+    out = []
+    for metric in _registry:
+        out.extend(metric.lines())
+    for fn in _collectors:
+        out.extend(fn())
+    return "\n".join(out) + "\n"
+
+
+_VERSION = re.compile(r"v?\d+(\.\d+)*$")
+
+
+def endpoint(url):
+    """Low-cardinality label for a URL: the path with ids folded to ``{id}``
+    (``/StationPrediction.svc/json/GetPrediction/A01`` -> ``.../GetPrediction/{id}``)."""
+    parts = []
+    for seg in urlsplit(url).path.split("/"):
+        if any(c.isdigit() for c in seg) and "." not in seg and not _VERSION.match(seg):
+            seg = "{id}"
+        parts.append(seg)
+    return "/".join(parts) or "/"
+
+
+upstream_seconds = Histogram("metro_upstream_request_seconds", "Upstream HTTP request latency.", ("upstream", "endpoint"))
+upstream_errors = Counter("metro_upstream_errors_total", "Upstream requests that failed or returned an error status.", ("upstream", "endpoint"))
+upstream_hedged = Counter("metro_upstream_hedged_total", "Hedge requests sent after the first exceeded its p95 deadline.", ("upstream", "endpoint"))
+upstream_in_flight = Gauge("metro_upstream_in_flight", "Upstream requests currently in flight.", ("upstream",))
+loader_seconds = Histogram("metro_cache_load_seconds", "Provider cache loader duration by key family.", ("family",))
+provider_seconds = Histogram("metro_provider_seconds", "Summary section provider duration.", ("section",))
+summary_seconds = Histogram("metro_summary_build_seconds", "Time to build and encode a summary.", ("profile",))
+loop_lag_seconds = Histogram("metro_event_loop_lag_seconds", "How late a periodic event-loop wakeup ran.",
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
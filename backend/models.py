@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+
+# Provider output records. Slotted, so a refresh allocates no per-row
+# __dict__; serialize.dumps encodes them as JSON objects with these fields.
+
+
+@dataclass(slots=True)
+class Train:
+    line: str
+    dest: str
+    minutes: object     # int, or "ARR" / "BRD" / "--"
+    cars: int
+    group: str          # track / direction, "1" or "2"
+
+
+@dataclass(slots=True)
+class RailStation:
+    code: str
+    name: str
+    arrivals: list      # by line, then direction, then minutes
+    codes: list         # both codes of a transfer station
+
+
+@dataclass(slots=True)
+class BusArrival:
+    route: str
+    headsign: str
+    minutes: int
+
+
+@dataclass(slots=True)
+class BusStop:
+    id: str
+    name: str
+    arrivals: list
+
+
+@dataclass(slots=True)
+class Dock:
+    id: str
+    name: str
+    bikes: int
+    docks: int
+    ebikes: int
+
+
+@dataclass(slots=True)
+class ForecastHour:
+    time: int
+    temp_f: float
+    pop: int
+    icon: str
+    summary: str
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Metrorail opening hours by weekday (Monday first), in Washington hours; a
+# close past 24 runs into the next morning. Buses run late enough that only
+# rail and incidents follow these.
+RAIL_HOURS = ((5, 24), (5, 24), (5, 24), (5, 24), (5, 25), (7, 25), (7, 24))
+# Not the host's zone: a kiosk left on UTC would close rail in the evening rush
+RAIL_TZ = "America/New_York"
+
+# Trains shown as arriving or boarding count as due now
+DUE = {"ARR": 0, "BRD": 0}
+
+
+def rail_open(now=None, hours=RAIL_HOURS, tz=RAIL_TZ):
+    """Whether Metrorail runs at ``now``, with ``hours`` read in ``tz``
+    (Washington time by default, whatever the host's zone)."""
+    t = datetime.fromtimestamp(time.time() if now is None else now, ZoneInfo(tz))
+    hour = t.hour + t.minute / 60
+    today = hours[t.weekday()]
+    yesterday = hours[(t.weekday() - 1) % 7]
+    # After midnight the previous day's late close still applies
+    return today[0] <= hour < today[1] or hour < yesterday[1] - 24
+
+
+def soonest(value):
+    """Minutes to the first rail or bus arrival in a provider value, or None."""
+    groups = (value or {}).get("stations") or (value or {}).get("stops") or []
+    best = None
+    for g in groups:
+        for a in g.arrivals:
+            m = DUE.get(a.minutes, a.minutes)
+            if isinstance(m, int) and (best is None or m < best):
+                best = m
+    return best
+
+
+def factor(key, value, cfg, now=None):
+    """Multiplier for a job's refresh interval given its last value.
+
+    Rail and bus refresh faster while something is arriving within
+    ``near_min``, slower when nothing is predicted or the next arrival is
+    ``far_min`` or more away; rail and incidents slow down further while
+    Metrorail is closed.
+    """
+    policy = cfg.get("adaptive", {})
+    if not policy.get("enabled", True) or key not in ("rail", "bus", "incidents"):
+        return 1.0
+    hours = [tuple(h) for h in policy.get("rail_hours") or RAIL_HOURS]
+    if key != "bus" and not rail_open(now, hours, policy.get("tz") or RAIL_TZ):
+        return float(policy.get("closed_factor", 8))
+    if key == "incidents":
+        return 1.0
+    first = soonest(value)
+    if first is None:
+        return float(policy.get("empty_factor", 4))
+    if first < float(policy.get("near_min", 3)):
+        return float(policy.get("near_factor", 0.5))
+    if first >= float(policy.get("far_min", 15)):
+        return float(policy.get("far_factor", 2))
+    return 1.0
+
+
+def interval(key, value, cfg, base, now=None):
+    """``base`` seconds scaled by ``factor`` and clamped to the policy bounds;
+    a fixed base longer than ``max_s`` is never shortened by it."""
+    policy = cfg.get("adaptive", {})
+    scaled = base * factor(key, value, cfg, now)
+    if scaled == base:
+        return base
+    lo = float(policy.get("min_s", 5))
+    hi = max(base, float(policy.get("max_s", 300)))
+    return min(hi, max(min(lo, base), scaled))
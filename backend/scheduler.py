@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+import time
+
+
+class Job:
+    """One provider refreshed on its own interval; keeps the last good value."""
+
+    def __init__(self, name, run, interval, stamped=False):
+        self.name = name
+        self.run = run              # async (cfg) -> value
+        self.interval = interval    # (cfg, value) -> seconds between refreshes
+        self.stamped = stamped      # summaries show updated_at: every refresh is a change
+        self.interval_s = None      # the interval last chosen
+        self.value = None
+        self.updated_at = None
+        self.error = None
+        self.failures = 0
+        self.duration_s = None      # how long the last refresh took
+        self.ready = asyncio.Event()
+        self.wake = asyncio.Event()     # set to cut the current delay short
+
+    def next_delay(self, cfg, jitter, max_backoff_s):
+        base = self.interval_s = max(1.0, float(self.interval(cfg, self.value)))
+        if self.failures:
+            return min(base * (2 ** self.failures), max(base, max_backoff_s))
+        # Jitter only ever delays, so a refresh never lands before the provider cache expires
+        return base * (1 + random.uniform(0, jitter))
+
+
+class Scheduler:
+    def __init__(self, jobs, load_config):
+        self.jobs = {job.name: job for job in jobs}
+        self.load_config = load_config
+        self.version = 0    # bumped whenever any job's value or error changes
+        self._changed = asyncio.Event()
+        self._tasks = []
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"refresh:{job.name}"))
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Wake waiters (open streams) so they notice the scheduler is gone
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def refresh(self, job, cfg):
+        before = (job.updated_at if job.stamped else job.updated_at is not None, job.value, job.error)
+        start = time.perf_counter()
+        try:
+            value = await job.run(cfg)
+            if value != job.value:
+                # An equal result keeps the old object, so its encoding can be reused
+                job.value = value
+            job.updated_at = time.time()
+            job.error = None
+            job.failures = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.error = str(e) or e.__class__.__name__
+            logging.warning("refresh %s failed (%d in a row): %s", job.name, job.failures, job.error)
+        finally:
+            job.duration_s = time.perf_counter() - start
+            if (job.updated_at if job.stamped else job.updated_at is not None, job.value, job.error) != before:
+                self.version += 1
+                changed, self._changed = self._changed, asyncio.Event()
+                changed.set()
+            job.ready.set()
+
+    def refresh_now(self, names=None):
+        """Wake the named jobs (all by default) so they refresh without waiting
+        out their interval, e.g. after the config they read has changed."""
+        for name in self.jobs if names is None else names:
+            if name in self.jobs:
+                self.jobs[name].wake.set()
+
+    async def wait_ready(self, name, timeout_s):
+        job = self.jobs[name]
+        if not job.ready.is_set():
+            try:
+                await asyncio.wait_for(job.ready.wait(), timeout_s)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def wait_change(self, version, timeout_s):
+        """Wait until the version moves past ``version``; False on timeout.
+        ``None`` (a summary built without this scheduler) waits for the next
+        change."""
+        if version is not None and self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _loop(self, job):
+        while True:
+            try:
+                cfg = self.load_config()
+            except Exception as e:
+                logging.warning("refresh %s: cannot load config: %s", job.name, e)
+                await asyncio.sleep(60)
+                continue
+            await self.refresh(job, cfg)
+            sched = cfg.get("scheduler", {})
+            delay = job.next_delay(cfg, float(sched.get("jitter", 0.1)), float(sched.get("max_backoff_s", 300)))
+            try:
+                await asyncio.wait_for(job.wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            job.wake.clear()
@@ -0,0 +1,26 @@
+import dataclasses
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_fields = {}
+
+
+def _plain(obj):
+    cls = type(obj)
+    names = _fields.get(cls)
+    if names is None:
+        if not dataclasses.is_dataclass(cls):
+            raise TypeError(f"{cls.__name__} is not JSON serializable")
+        names = _fields[cls] = tuple(f.name for f in dataclasses.fields(cls))
+    return {n: getattr(obj, n) for n in names}
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes; uses orjson when installed (``pip install orjson``)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_plain).encode("utf-8")
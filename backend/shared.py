@@ -0,0 +1,115 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# Entries untouched this long are dropped; metadata is refreshed daily
+KEEP_S = 7 * 24 * 3600
+
+
+class SharedStore:
+    """Cache entries shared by the worker processes on one host.
+
+    A SQLite database in WAL mode, so readers never wait on the writer;
+    values are pickled. Leases give cross-process single-flight: one worker
+    at a time holds a key's lease and refreshes it while the others wait
+    for its result. A lease expires after ``lease_s``, so a worker that dies
+    mid-load only delays the rest. Database errors are logged and treated
+    as a miss, so a broken file degrades to per-worker caching.
+    """
+
+    def __init__(self, path, lease_s=30.0):
+        self.path = path
+        self.lease_s = lease_s
+        self.owner = f"{os.getpid()}:{id(self):x}"
+        self._local = threading.local()
+        self._puts = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS entries "
+                   "(key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, value BLOB NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS leases "
+                   "(key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _db(self):
+        # One connection per thread: loads run on the event loop, lookups in
+        # worker threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        """``(fetched_at, value)`` or None."""
+        try:
+            row = self._db().execute("SELECT fetched_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+            return (row[0], pickle.loads(row[1])) if row else None
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logging.warning("shared cache: reading %s failed: %s", key, e)
+            return None
+
+    def put(self, key, value, fetched_at):
+        """Store ``value`` unless another worker already stored a newer one."""
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logging.warning("shared cache: %s is not shareable: %s", key, e)
+            return
+        try:
+            db = self._db()
+            db.execute(
+                "INSERT INTO entries VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE "
+                "SET fetched_at = excluded.fetched_at, value = excluded.value "
+                "WHERE excluded.fetched_at > entries.fetched_at",
+                (key, fetched_at, blob),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                db.execute("DELETE FROM entries WHERE fetched_at < ?", (time.time() - KEEP_S,))
+        except sqlite3.Error as e:
+            logging.warning("shared cache: writing %s failed: %s", key, e)
+
+    def acquire(self, key):
+        """Take the refresh lease for ``key``; False while another worker holds it."""
+        now = time.time()
+        try:
+            cur = self._db().execute(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE "
+                "SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.expires < ? OR leases.owner = excluded.owner",
+                (key, self.owner, now + self.lease_s, now),
+            )
+            return cur.rowcount == 1
+        except sqlite3.Error as e:
+            logging.warning("shared cache: lease for %s failed: %s", key, e)
+            return True
+
+    def release(self, key):
+        try:
+            self._db().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+        except sqlite3.Error as e:
+            logging.warning("shared cache: releasing %s failed: %s", key, e)
+
+    def delete(self, key=None, prefix=None):
+        try:
+            db = self._db()
+            if key is None and prefix is None:
+                db.execute("DELETE FROM entries")
+                return
+            if key is not None:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if prefix is not None:
+                db.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        except sqlite3.Error as e:
+            logging.warning("shared cache: delete failed: %s", e)
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
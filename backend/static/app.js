@@ -5,122 +5,276 @@ function fmtSS(d=new Date()){
   return d.toLocaleTimeString([], {second:'2-digit'});
 }
 
-function updateClock(){
-  const now = new Date();
-  const el = document.getElementById('clock');
-  el.querySelector('.hhmm').textContent = fmtHHMM(now);
-  el.querySelector('.ss').textContent = fmtSS(now);
+// Only touch the DOM when the text actually changes
+function setText(el, text){
+  text = text == null ? '' : String(text);
+  if (el.textContent !== text) el.textContent = text;
+}
+function setClass(el, cls){
+  if (el.className !== cls) el.className = cls;
+}
+
+function el(tag, cls, parent){
+  const e = document.createElement(tag);
+  if (cls) e.className = cls;
+  if (parent) parent.appendChild(e);
+  return e;
+}
+
+// Keyed list patching: rows are created once per key, updated in place and
+// only moved when their position changes. `make(item)` builds a node,
+// `update(node, item)` patches it.
+function patchList(container, items, key, make, update){
+  const rows = container._rows || (container._rows = new Map());
+  const seen = new Set();
+  let before = container.firstChild;
+  items.forEach(item => {
+    let k = key(item);
+    // Identical keys (e.g. repeated incident text) get their own rows
+    for (let n = 2; seen.has(k); n++) k = `${key(item)}#${n}`;
+    seen.add(k);
+    let node = rows.get(k);
+    if (!node){
+      node = make(item);
+      rows.set(k, node);
+    }
+    update(node, item);
+    if (node !== before) container.insertBefore(node, before);
+    else before = before.nextSibling;
+  });
+  rows.forEach((node, k) => {
+    if (!seen.has(k)){
+      node.remove();
+      rows.delete(k);
+    }
+  });
+}
+
+function groupLabel(){
+  return el('div', 'group-label');
+}
+
+function arrivalRow(){
+  const div = el('div', 'row');
+  el('span', 'badge', div);
+  el('div', 'dest', div);
+  el('div', 'minutes', div);
+  return div;
+}
+
+function updateArrival(div, badgeClass, badge, dest, minutes){
+  const [b, d, m] = div.children;
+  setClass(b, badgeClass);
+  setText(b, badge);
+  setText(d, dest);
+  setText(m, minutes);
 }
 
+// Flatten stations/stops into label + row entries keyed by their slot, so a
+// minutes change only rewrites one text node
+function boardItems(groups, id, label){
+  const out = [];
+  groups.forEach(g => {
+    const gid = id(g);
+    out.push({key: `${gid}`, label: label(g)});
+    const slots = {};
+    (g.arrivals || []).forEach(a => {
+      const slot = `${a.line || a.route}:${a.group || ''}`;
+      slots[slot] = (slots[slot] || 0) + 1;
+      out.push({key: `${gid}:${slot}:${slots[slot]}`, arrival: a});
+    });
+  });
+  return out;
+}
+
+// The server refreshes predictions less often when nothing is close, so
+// numeric minutes count down locally from when the server fetched each section
+const receivedAt = {rail: Date.now(), bus: Date.now()};
+const fetchedAt = {};
+function elapsedMin(section){
+  return Math.floor((Date.now() - receivedAt[section]) / 60000);
+}
+function countdown(minutes, elapsed){
+  return typeof minutes === 'number' ? Math.max(0, minutes - elapsed) : minutes;
+}
+
+function patchBoard(container, items, badgeClass, badge, dest, elapsed){
+  patchList(container, items, i => i.key,
+    i => i.arrival ? arrivalRow() : groupLabel(),
+    (node, i) => {
+      if (!i.arrival){ setText(node, i.label); return; }
+      const a = i.arrival;
+      updateArrival(node, badgeClass(a), badge(a), dest(a), countdown(a.minutes, elapsed));
+    });
+}
+
+function updateClock(now=new Date()){
+  const clock = document.getElementById('clock');
+  setText(clock.querySelector('.hhmm'), fmtHHMM(now));
+  setText(clock.querySelector('.ss'), fmtSS(now));
+}
+
+const perf = window.metroPerf = {renders: []};
+
 function render(summary){
+  const t0 = performance.now();
+  shownElapsed = `${elapsedMin('rail')}:${elapsedMin('bus')}`;
   updateClock();
   const updatedAt = summary.updated_at ? new Date(summary.updated_at*1000) : new Date();
-  document.getElementById('updated').textContent = `Updated: ${fmtHHMM(updatedAt)}`;
-
-  const railRows = document.getElementById('rail-rows');
-  railRows.innerHTML = '';
-  (summary.rail?.stations || []).forEach(st => {
-    const gl = document.createElement('div');
-    gl.className = 'group-label';
-    gl.textContent = st.name || st.code || 'Station';
-    railRows.appendChild(gl);
-    (st.arrivals || []).forEach(a => {
-      const div = document.createElement('div');
-      div.className = 'row';
-      div.innerHTML = `
-        <span class="badge ${a.line}">${a.line}</span>
-        <div class="dest">${a.dest || ''}</div>
-        <div class="minutes">${a.minutes}</div>
-      `;
-      railRows.appendChild(div);
-    })
-  });
+  setText(document.getElementById('updated'), `Updated: ${fmtHHMM(updatedAt)}`);
 
-  const busRows = document.getElementById('bus-rows');
-  busRows.innerHTML = '';
-  (summary.bus?.stops || []).forEach(st => {
-    const gl = document.createElement('div');
-    gl.className = 'group-label';
-    gl.textContent = st.name || st.id || 'Stop';
-    busRows.appendChild(gl);
-    (st.arrivals || []).forEach(a => {
-      const div = document.createElement('div');
-      div.className = 'row';
-      div.innerHTML = `
-        <span class="badge">${a.route}</span>
-        <div class="dest">${a.headsign || ''}</div>
-        <div class="minutes">${a.minutes}</div>
-      `;
-      busRows.appendChild(div);
-    })
-  });
+  patchBoard(document.getElementById('rail-rows'),
+    boardItems(summary.rail?.stations || [], st => `r:${st.code}`, st => st.name || st.code || 'Station'),
+    a => `badge ${a.line}`, a => a.line, a => a.dest || '', elapsedMin('rail'));
+  patchBoard(document.getElementById('bus-rows'),
+    boardItems(summary.bus?.stops || [], st => `b:${st.id}`, st => st.name || st.id || 'Stop'),
+    () => 'badge', a => a.route, a => a.headsign || '', elapsedMin('bus'));
 
   const w = summary.weather?.now || {};
-  const iconEl = document.querySelector('#weather .icon');
-  const textEl = document.querySelector('#weather .text');
-  iconEl.textContent = w.icon || getWeatherIcon(w.summary || '');
+  setText(document.querySelector('#weather .icon'), w.icon || getWeatherIcon(w.summary || ''));
   const parts = [];
   if (w.temp_f !== undefined) parts.push(`${Math.round(w.temp_f)}°F`);
   else if (w.temp_c !== undefined) parts.push(`${Math.round(w.temp_c)}°C`);
   if (w.summary) parts.push(w.summary);
   if (w.wind_mph !== undefined) parts.push(`${Math.round(w.wind_mph)} mph wind`);
   else if (w.wind_kph !== undefined) parts.push(`${Math.round(w.wind_kph)} kph wind`);
-  textEl.textContent = parts.join(' • ');
+  setText(document.querySelector('#weather .text'), parts.join(' • '));
 
   // Hourly forecast strip
-  const hourly = summary.weather?.hourly || [];
-  const hEl = document.getElementById('hourly');
-  hEl.innerHTML = '';
-  hourly.forEach(h => {
-    const d = new Date(h.time*1000);
-    const hh = d.toLocaleTimeString([], {hour:'numeric'});
-    const div = document.createElement('div');
-    div.className = 'hour';
-    div.innerHTML = `
-      <div class="hicon">${h.icon || ''}</div>
-      <div class="htemp">${Math.round(h.temp_f)}°</div>
-      <div class="hpop">${h.pop != null ? (h.pop + '%') : ''}</div>
-      <div class="hwhen">${hh}</div>
-    `;
-    hEl.appendChild(div);
+  patchList(document.getElementById('hourly'), summary.weather?.hourly || [], h => h.time,
+    () => {
+      const div = el('div', 'hour');
+      ['hicon', 'htemp', 'hpop', 'hwhen'].forEach(c => el('div', c, div));
+      return div;
+    },
+    (div, h) => {
+      const [icon, temp, pop, when] = div.children;
+      setText(icon, h.icon || '');
+      setText(temp, `${Math.round(h.temp_f)}°`);
+      setText(pop, h.pop != null ? (h.pop + '%') : '');
+      setText(when, new Date(h.time*1000).toLocaleTimeString([], {hour:'numeric'}));
+    });
+
+  // Weather alerts, service impacts, bikeshare: one text row each
+  const textRows = (container, items, key, text) =>
+    patchList(container, items, key, () => el('div'), (div, i) => setText(div, text(i)));
+  textRows(document.querySelector('#wx-alerts .text'), summary.weather?.alerts || [],
+    a => `${a.event}:${a.headline}`, a => `${a.event || 'Alert'}: ${a.headline || ''}`);
+  textRows(document.getElementById('incidents-rows'), summary.incidents || [], i => i.text, i => i.text);
+  textRows(document.getElementById('bike-rows'), summary.bike?.stations || [], s => s.id, s => {
+    const eb = (s.ebikes !== undefined && s.ebikes !== null) ? ` • ⚡ ${s.ebikes} e-bikes` : '';
+    return `${s.name}: ${s.bikes} bikes • ${s.docks} docks${eb}`;
   });
 
-  // Weather alerts
-  const wa = summary.weather?.alerts || [];
-  const waEl = document.querySelector('#wx-alerts .text');
-  waEl.innerHTML = wa.map(a => `<div>${a.event || 'Alert'}: ${a.headline || ''}</div>`).join('');
+  const errs = Array.isArray(summary.errors) ? summary.errors : [];
+  setText(document.querySelector('#errors .text'), errs.join('\n'));
 
-  const inc = document.getElementById('incidents');
-  inc.innerHTML = '<h3>Service Impacts</h3>' + (summary.incidents||[]).map(i=>`<div>${i.text}</div>`).join('');
+  perf.renders.push(performance.now() - t0);
+  if (perf.renders.length > 500) perf.renders.shift();
+}
 
-  const bike = document.getElementById('bike');
-  bike.innerHTML = '<h3>Capital Bikeshare — bikes | docks</h3>' + (summary.bike?.stations||[]).map(s=>{
-    const eb = (s.ebikes !== undefined && s.ebikes !== null) ? ` • ⚡ ${s.ebikes} e-bikes` : '';
-    return `<div>${s.name}: ${s.bikes} bikes • ${s.docks} docks${eb}</div>`;
-  }).join('');
-
-  const errs = document.querySelector('#errors .text');
-  if (Array.isArray(summary.errors) && summary.errors.length){
-    errs.textContent = summary.errors.join('\n');
-  } else {
-    errs.textContent = '';
-  }
+// Restart the countdown only for sections the server fetched anew
+function received(sections){
+  const fetched = sections.fetched_at || {};
+  const now = Date.now();
+  Object.keys(receivedAt).forEach(k => {
+    if (!fetched[k] || fetched[k] === fetchedAt[k]) return;
+    fetchedAt[k] = fetched[k];
+    // A kiosk clock behind the server's must not count up
+    receivedAt[k] = Math.min(now, fetched[k] * 1000);
+  });
+}
+
+// Updates are coalesced into one DOM pass per animation frame
+let pending = null;
+function schedule(summary){
+  const first = pending === null;
+  pending = summary;
+  if (first) requestAnimationFrame(() => { const s = pending; pending = null; render(s); });
 }
 
+// Multi-display setups open the page as /?profile=<name>
+const PROFILE = new URLSearchParams(location.search).get('profile');
+const QUERY = PROFILE ? `?profile=${encodeURIComponent(PROFILE)}` : '';
+
+let state = {};
+let shownElapsed = '';
+let lastEtag = null;
+let pollTimer = null;
+let stream = null;
+let clockTimer = null;
+
 async function tick(){
   try{
-    const res = await fetch('/v1/summary');
-    const json = await res.json();
-    render(json);
+    const res = await fetch('/v1/summary' + QUERY);
+    const etag = res.headers.get('etag');
+    // The browser revalidates with the ETag; an unchanged body needs no render
+    if (etag && etag === lastEtag) return;
+    lastEtag = etag;
+    state = await res.json();
+    received(state);
+    schedule(state);
   }catch(e){
     console.error('update failed', e);
   }
 }
 
-setInterval(updateClock, 1000);
+function startPolling(){
+  if (pollTimer) return;
+  tick();
+  pollTimer = setInterval(tick, 10000);
+}
+
+function stopPolling(){
+  clearInterval(pollTimer);
+  pollTimer = null;
+}
+
+// Prefer the server-push stream: a full snapshot on connect, then only the
+// sections that changed. Fall back to polling if it is unavailable.
+function startStream(){
+  if (!window.EventSource){ startPolling(); return; }
+  const es = stream = new EventSource('/v1/stream' + QUERY);
+  es.addEventListener('snapshot', e => { state = JSON.parse(e.data); received(state); schedule(state); });
+  es.addEventListener('delta', e => {
+    const delta = JSON.parse(e.data);
+    received(delta);
+    Object.assign(state, delta);
+    schedule(state);
+  });
+  es.onerror = () => {
+    // EventSource reconnects by itself; CLOSED means the server refused (e.g. 503)
+    if (es.readyState === EventSource.CLOSED){ stream = null; startPolling(); }
+  };
+}
+
+// Tick the clock on second boundaries, drawing inside an animation frame
+function startClock(){
+  clearTimeout(clockTimer);
+  requestAnimationFrame(() => updateClock());
+  // Redraw the boards when a countdown minute passes
+  if (state.updated_at && `${elapsedMin('rail')}:${elapsedMin('bus')}` !== shownElapsed) schedule(state);
+  clockTimer = setTimeout(startClock, 1000 - (Date.now() % 1000));
+}
+
+function start(){
+  startClock();
+  startStream();
+}
+
+// Nothing is fetched or drawn while the page is hidden
+function stop(){
+  clearTimeout(clockTimer);
+  stopPolling();
+  if (stream){ stream.close(); stream = null; }
+}
+
+document.addEventListener('visibilitychange', () => {
+  if (document.hidden) stop();
+  else { stop(); start(); }
+});
 
-tick();
-setInterval(tick, 10000);
+start();
 
 function getWeatherIcon(summary){
   const s = summary.toLowerCase();
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+# Slow-changing reference data (station metadata, GBFS feeds) survives restarts
+# here as one compact JSON file per cache key, with the upstream validators.
+_dir = os.getenv("METRO_DATA_DIR", "data")
+
+
+def configure(data_dir=None):
+    global _dir
+    _dir = os.getenv("METRO_DATA_DIR") or data_dir or _dir
+
+
+def _path(key):
+    return os.path.join(_dir, "cache", f"{key}.json")
+
+
+def shared_path():
+    """SQLite file for the cache shared between uvicorn workers."""
+    return os.path.join(_dir, "cache", "shared.sqlite3")
+
+
+def history_dir():
+    """Directory of the arrival and dock history logs (backend/history.py)."""
+    return os.path.join(_dir, "history")
+
+
+def read(key):
+    try:
+        with open(_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("ignoring unreadable cache file for %s: %s", key, e)
+        return None
+
+
+def write(key, record):
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"     # workers may write the same key
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def warm(cache):
+    """Seed the in-memory cache with every persisted entry (at its original age)."""
+    folder = os.path.join(_dir, "cache")
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return 0
+    n = 0
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        key = name[:-5]
+        record = read(key)
+        if record and "value" in record:
+            cache.put(key, record["value"], fetched_at=record.get("fetched_at"))
+            n += 1
+    return n
+
+
+async def fetch_json(key, upstream, url, parse, priority=None):
+    """Fetch ``url`` and persist ``parse(json)`` under ``key``.
+
+    Revalidates with If-None-Match / If-Modified-Since against the stored copy,
+    so an unchanged feed costs a 304 instead of a full download and re-parse.
+    """
+    from .upstream import get     # httpx loads with the first fetch, not at import
+    saved = read(key)
+    headers = {}
+    if saved and saved.get("url") == url:
+        if saved.get("etag"):
+            headers["If-None-Match"] = saved["etag"]
+        if saved.get("last_modified"):
+            headers["If-Modified-Since"] = saved["last_modified"]
+    r = await get(upstream, url, headers=headers or None, priority=priority)
+    if r.status_code == 304 and headers:
+        record = dict(saved, fetched_at=time.time())
+    else:
+        record = {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "value": parse(r.json()),
+        }
+    try:
+        await asyncio.to_thread(write, key, record)
+    except OSError as e:
+        logging.warning("could not persist %s: %s", key, e)
+    return record["value"]
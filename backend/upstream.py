@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+import httpx
+from . import metrics
+from .breaker import UPSTREAMS, CircuitOpen, breaker_for
+from .budget import budgets, parse_retry_after
+
+USER_AGENT = "metro-clock/1.0 (+https://github.com/jamesdahall/metro_clock)"
+
+# One keep-alive client per upstream so connection limits and default headers
+# apply per host (api.wmata.com, gbfs, api.open-meteo.com, api.weather.gov).
+BASE_URLS = {
+    "wmata": "https://api.wmata.com",
+    "gbfs": "https://gbfs.capitalbikeshare.com",
+    "open_meteo": "https://api.open-meteo.com",
+    "nws": "https://api.weather.gov",
+}
+
+_clients = {}
+_loop = None
+
+
+def base_url(name):
+    """Upstream origin; METRO_<NAME>_URL (e.g. METRO_WMATA_URL) points it at a
+    stub server for offline benchmarks."""
+    return os.getenv(f"METRO_{name.upper()}_URL") or BASE_URLS[name]
+
+
+def _default_headers(name):
+    headers = {"User-Agent": USER_AGENT}
+    if name == "wmata":
+        headers["api_key"] = os.getenv("WMATA_API_KEY", "")
+    return headers
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _new_client(name, http_cfg=None, pooled=True, **kwargs):
+    http_cfg = http_cfg or {}
+    http2 = bool(http_cfg.get("http2", True)) and pooled and _http2_available()
+    limits = httpx.Limits(
+        max_connections=int(http_cfg.get("max_connections_per_host", 10)),
+        max_keepalive_connections=int(http_cfg.get("max_connections_per_host", 10)),
+        keepalive_expiry=float(http_cfg.get("keepalive_s", 60)),
+    )
+    return httpx.AsyncClient(
+        headers=_default_headers(name),
+        limits=limits,
+        http2=http2,
+        timeout=float(http_cfg.get("timeout_s", 10)),
+        **kwargs,
+    )
+
+
+async def open_pool(http_cfg=None):
+    global _loop
+    await close_pool()
+    if (http_cfg or {}).get("http2", True) and not _http2_available():
+        logging.info("h2 not installed; upstream clients use HTTP/1.1 keep-alive")
+    for name in UPSTREAMS:
+        _clients[name] = _new_client(name, http_cfg)
+    _loop = asyncio.get_running_loop()
+
+
+async def close_pool():
+    global _loop
+    clients = list(_clients.values())
+    _clients.clear()
+    _loop = None
+    for c in clients:
+        await c.aclose()
+
+
+# Recent successful latencies per (upstream, endpoint), for hedge deadlines
+_recent = defaultdict(lambda: deque(maxlen=200))
+HEDGE_MIN_SAMPLES = 20
+
+
+@asynccontextmanager
+async def _timed(upstream, url):
+    ep = metrics.endpoint(url)
+    timing = {"status": None}
+    breaker = breaker_for(upstream)
+    metrics.upstream_in_flight.inc(upstream)
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield timing
+    except asyncio.CancelledError:
+        # Cancelled by a section timeout or a faster hedge: only slowness counts
+        metrics.upstream_errors.inc(upstream, ep)
+        ok = None
+        raise
+    except BaseException as e:
+        metrics.upstream_errors.inc(upstream, ep)
+        # A 5xx raised inside the block (stream's raise_for_status) is a failure
+        status = timing["status"]
+        ok = not isinstance(e, (httpx.TransportError, TimeoutError)) and (status is None or status < 500)
+        raise
+    else:
+        status = timing["status"]
+        if status is not None and status >= 400:
+            metrics.upstream_errors.inc(upstream, ep)
+        ok = status is None or status < 500
+        if status is not None and status < 400:
+            _recent[(upstream, ep)].append(time.perf_counter() - start)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.upstream_in_flight.dec(upstream)
+        metrics.upstream_seconds.observe(elapsed, upstream, ep)
+        if ok is not None or elapsed > breaker.slow_s:
+            breaker.record(bool(ok), elapsed)
+
+
+def hedge_after(upstream, url):
+    """p95 of recent successful calls to this endpoint, or None until enough are seen."""
+    samples = _recent.get((upstream, metrics.endpoint(url)))
+    if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return max(0.05, ordered[int(len(ordered) * 0.95) - 1])
+
+
+def _guard(upstream, url, priority):
+    breaker = breaker_for(upstream)
+    if breaker.opened_at is None:
+        return
+    if breaker.reject():
+        task = asyncio.get_running_loop().create_task(_fetch(upstream, url, {}, priority))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    raise CircuitOpen(f"{upstream} unavailable (circuit open)")
+
+
+async def _acquire(upstream, priority):
+    budget = budgets.get(upstream)
+    if budget is not None:
+        await budget.acquire(priority or "bus")
+
+
+async def _fetch(upstream, url, kwargs, priority):
+    await _acquire(upstream, priority)
+    return await _send(upstream, url, kwargs)
+
+
+async def _send(upstream, url, kwargs):
+    budget = budgets.get(upstream)
+    client = _clients.get(upstream)
+    async with _timed(upstream, url) as timing:
+        if client is not None and asyncio.get_running_loop() is _loop:
+            r = await client.get(url, **kwargs)
+        else:
+            # No pool on this event loop (sync wrappers, scripts): fall back to a one-shot client
+            async with _new_client(upstream, pooled=False) as c:
+                r = await c.get(url, **kwargs)
+        timing["status"] = r.status_code
+    if budget is not None and (r.status_code == 429 or (r.status_code == 503 and "Retry-After" in r.headers)):
+        wait = parse_retry_after(r.headers.get("Retry-After"))
+        logging.warning("%s throttled (%d); pausing calls for %.0fs", upstream, r.status_code, wait)
+        budget.throttle(wait)
+    if r.status_code != 304:
+        r.raise_for_status()
+    return r
+
+
+async def _hedged(upstream, url, kwargs, priority, after_s):
+    # The deadline runs from when the request is sent, not from the budget wait
+    await _acquire(upstream, priority)
+    first = asyncio.ensure_future(_send(upstream, url, kwargs))
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=after_s)
+        if done:
+            return first.result()
+        metrics.upstream_hedged.inc(upstream, metrics.endpoint(url))
+        tasks.append(asyncio.ensure_future(_fetch(upstream, url, kwargs, priority)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+        return first.result()
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+async def get(upstream, url, headers=None, timeout=None, priority=None, hedge=False):
+    """GET via the pooled client; raises for error statuses (304 is returned).
+
+    Upstreams with a budget (WMATA) wait for a token first and back off on
+    429 / Retry-After. Raises CircuitOpen at once while the upstream's
+    breaker is open. With ``hedge``, a second identical request is sent if
+    the first hasn't answered by the endpoint's recent p95, and whichever
+    succeeds first wins.
+    """
+    _guard(upstream, url, priority)
+    kwargs = {"headers": headers}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    after_s = hedge_after(upstream, url) if hedge else None
+    if after_s is None:
+        return await _fetch(upstream, url, kwargs, priority)
+    return await _hedged(upstream, url, kwargs, priority, after_s)
+
+
+async def get_json(upstream, url, headers=None, timeout=None, priority=None, hedge=False):
+    return (await get(upstream, url, headers=headers, timeout=timeout, priority=priority, hedge=hedge)).json()
+
+
+@asynccontextmanager
+async def stream(upstream, url, headers=None, timeout=None):
+    """Like ``get`` but yields the response unread, for ``aiter_bytes()``."""
+    _guard(upstream, url, None)
+    kwargs = {"headers": headers}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    budget = budgets.get(upstream)
+    if budget is not None:
+        await budget.acquire("bus")
+    client = _clients.get(upstream)
+    # Timed until the body has been consumed by the caller
+    async with _timed(upstream, url) as timing:
+        if client is not None and asyncio.get_running_loop() is _loop:
+            async with client.stream("GET", url, **kwargs) as r:
+                timing["status"] = r.status_code
+                r.raise_for_status()
+                yield r
+        else:
+            async with _new_client(upstream, pooled=False) as c:
+                async with c.stream("GET", url, **kwargs) as r:
+                    timing["status"] = r.status_code
+                    r.raise_for_status()
+                    yield r
@@ -1,33 +1,25 @@
+import asyncio
+import bisect
 import time
-import httpx
+from array import array
+from datetime import datetime, timezone
+from .cache import cache
+from .models import ForecastHour
+from .upstream import base_url, get_json
 
-_cache = {}
 
-
-def _cached(key, ttl_s, loader):
-    now = time.time()
-    entry = _cache.get(key)
-    if entry and now - entry[0] < ttl_s:
-        return entry[1]
-    val = loader()
-    _cache[key] = (now, val)
-    return val
-
-
-def current_weather(config):
+async def current_weather_async(config):
     # Open-Meteo current weather (Fahrenheit, mph)
     home = config.get("home", {})
     lat = home.get("lat", 38.8895)
     lon = home.get("lon", -77.0353)
-    def load():
+    async def load():
         url = (
-            "https://api.open-meteo.com/v1/forecast"
+            f"{base_url('open_meteo')}/v1/forecast"
             f"?latitude={lat}&longitude={lon}"
             "&current_weather=true&temperature_unit=fahrenheit&windspeed_unit=mph"
         )
-        r = httpx.get(url, timeout=10)
-        r.raise_for_status()
-        cw = r.json().get("current_weather") or {}
+        cw = (await get_json("open_meteo", url)).get("current_weather") or {}
         temp_f = cw.get("temperature")
         wind_mph = cw.get("windspeed")
         code = cw.get("weathercode")
@@ -37,66 +29,92 @@ def current_weather(config):
             "summary": _wm_summary(code),
             "icon": _wm_icon(code),
         }
-    return _cached("weather_current", int(config.get("weather", {}).get("refresh_s", 600)), load)
+    return await cache.aget(f"weather_current_{lat},{lon}", int(config.get("weather", {}).get("refresh_s", 600)), load)
+
+
+def current_weather(config):
+    return asyncio.run(current_weather_async(config))
+
+
+class Forecast:
+    """Hourly forecast as parallel columns sorted by UTC epoch.
+
+    Built once per fetch; any horizon or time window is a bisect + slice.
+    """
+
+    def __init__(self, times, temps, pops, codes, utc_offset_s=0):
+        n = min(len(times), len(temps), len(pops), len(codes))
+        self.times = array("q", times[:n])
+        self.temps = temps[:n]
+        self.pops = pops[:n]
+        self.codes = codes[:n]
+        self.utc_offset_s = utc_offset_s
+        labels = {c: (_wm_icon(c), _wm_summary(c)) for c in set(self.codes)}
+        self.icons = [labels[c][0] for c in self.codes]
+        self.summaries = [labels[c][1] for c in self.codes]
+
+    def __len__(self):
+        return len(self.times)
+
+    def window(self, start=None, end=None, hours=None):
+        """Hours with ``start - 3600 < time < end`` (so the current hour is
+        included), at most ``hours`` of them."""
+        lo = 0 if start is None else bisect.bisect_right(self.times, start - 3600)
+        hi = len(self.times) if end is None else bisect.bisect_left(self.times, end)
+        if hours is not None:
+            hi = min(hi, lo + hours)
+        return [ForecastHour(self.times[i], self.temps[i], self.pops[i], self.icons[i], self.summaries[i])
+                for i in range(lo, hi)]
 
 
-def hourly_forecast(config, hours=12):
+def _epochs(times, utc_offset_s):
+    # timeformat=unixtime already gives UTC epochs; local ISO strings are
+    # shifted by the offset Open-Meteo reports for timezone=auto
+    if not times or not isinstance(times[0], str):
+        return [int(t) for t in times]
+    return [int(datetime.fromisoformat(t).replace(tzinfo=timezone.utc).timestamp()) - utc_offset_s
+            for t in times]
+
+
+async def _forecast(config):
     home = config.get("home", {})
     lat = home.get("lat", 38.8895)
     lon = home.get("lon", -77.0353)
-    def load():
+    weather = config.get("weather", {})
+    days = int(weather.get("forecast_days", 7))
+    async def load():
         url = (
-            "https://api.open-meteo.com/v1/forecast"
+            f"{base_url('open_meteo')}/v1/forecast"
             f"?latitude={lat}&longitude={lon}"
             "&hourly=temperature_2m,precipitation_probability,weathercode"
-            "&forecast_days=2&timezone=auto&temperature_unit=fahrenheit&windspeed_unit=mph"
+            f"&forecast_days={days}&timezone=auto&timeformat=unixtime"
+            "&temperature_unit=fahrenheit&windspeed_unit=mph"
         )
-        r = httpx.get(url, timeout=10)
-        r.raise_for_status()
-        data = r.json().get("hourly", {})
-        times = data.get("time", [])
-        temps = data.get("temperature_2m", [])
-        pops = data.get("precipitation_probability", [])
-        codes = data.get("weathercode", [])
-        out = []
-        now = time.time()
-        def parse_iso(ts):
-            try:
-                y=int(ts[0:4]); m=int(ts[5:7]); d=int(ts[8:10]); hh=int(ts[11:13]); mm=int(ts[14:16])
-                import datetime
-                dt = datetime.datetime(y,m,d,hh,mm)
-                return int(dt.timestamp())
-            except Exception:
-                return None
-        for i in range(min(len(times), len(temps), len(pops), len(codes))):
-            ts = parse_iso(times[i])
-            if ts is None:
-                continue
-            if ts + 3600 < now:
-                continue
-            out.append({
-                "time": ts,
-                "temp_f": temps[i],
-                "pop": pops[i],
-                "icon": _wm_icon(codes[i]),
-                "summary": _wm_summary(codes[i]),
-            })
-            if len(out) >= hours:
-                break
-        return out
-    return _cached("weather_hourly", 600, load)
+        doc = await get_json("open_meteo", url)
+        data = doc.get("hourly", {})
+        offset = int(doc.get("utc_offset_seconds") or 0)
+        return Forecast(_epochs(data.get("time", []), offset), data.get("temperature_2m", []),
+                        data.get("precipitation_probability", []), data.get("weathercode", []), offset)
+    return await cache.aget(f"weather_hourly_{lat},{lon}_{days}d", int(weather.get("refresh_s", 600)), load)
 
 
-def weather_alerts(config):
+async def hourly_forecast_async(config, hours=12, start=None, end=None):
+    """``hours`` forecast hours from ``start`` (default now) up to ``end``."""
+    forecast = await _forecast(config)
+    return forecast.window(time.time() if start is None else start, end, hours)
+
+
+def hourly_forecast(config, hours=12, start=None, end=None):
+    return asyncio.run(hourly_forecast_async(config, hours=hours, start=start, end=end))
+
+
+async def weather_alerts_async(config):
     home = config.get("home", {})
     lat = home.get("lat", 38.8895)
     lon = home.get("lon", -77.0353)
-    def load():
-        headers = {"User-Agent": "metro-clock/1.0 (+https://github.com/jamesdahall/metro_clock)"}
-        url = f"https://api.weather.gov/alerts/active?point={lat},{lon}"
-        r = httpx.get(url, headers=headers, timeout=10)
-        r.raise_for_status()
-        feats = (r.json().get("features") or [])
+    async def load():
+        url = f"{base_url('nws')}/alerts/active?point={lat},{lon}"
+        feats = ((await get_json("nws", url)).get("features") or [])
         out = []
         for f in feats:
             p = f.get("properties", {})
@@ -107,7 +125,11 @@ def weather_alerts(config):
                 "ends": p.get("ends"),
             })
         return out[:5]
-    return _cached("weather_alerts", 300, load)
+    return await cache.aget(f"weather_alerts_{lat},{lon}", 300, load)
+
+
+def weather_alerts(config):
+    return asyncio.run(weather_alerts_async(config))
 
 
 def _wm_summary(code):
@@ -1,33 +1,21 @@
-import time
+import asyncio
 import os
-import httpx
+from . import geo, store
+from .cache import cache
+from .models import BusArrival, BusStop, RailStation, Train
+from .upstream import base_url, get_json
 from .util import haversine_m
 
-_cache = {}
+# Cache and store key for station metadata; store.warm() seeds the cache from
+# the file of the same name. Bumped when "together" was added, so metadata
+# stored without it (stations_meta.json) is never read.
+STATIONS_KEY = "stations_meta_v2"
 
 
-def _cached(key, ttl_s, loader):
-    now = time.time()
-    entry = _cache.get(key)
-    if entry and now - entry[0] < ttl_s:
-        return entry[1]
-    val = loader()
-    _cache[key] = (now, val)
-    return val
-
-
-def _wmata_headers():
-    return {"api_key": os.getenv("WMATA_API_KEY", "")}
-
-
-def _stations_meta():
-    def load():
-        url = "https://api.wmata.com/Rail.svc/json/jStations"
-        r = httpx.get(url, headers=_wmata_headers(), timeout=10)
-        r.raise_for_status()
-        data = r.json().get("Stations", [])
+async def _stations_meta():
+    def parse(data):
         meta = {}
-        for s in data:
+        for s in data.get("Stations", []):
             code = s.get("Code")
             if not code:
                 continue
@@ -35,74 +23,132 @@ def _stations_meta():
                 "name": s.get("Name"),
                 "lat": s.get("Lat"),
                 "lon": s.get("Lon"),
+                # The other code of a transfer station (Metro Center A01/C01)
+                "together": s.get("StationTogether1") or None,
             }
         return meta
 
-    return _cached("stations_meta", 24 * 3600, load)
+    async def load():
+        url = f"{base_url('wmata')}/Rail.svc/json/jStations"
+        return await store.fetch_json(STATIONS_KEY, "wmata", url, parse, priority="meta")
 
+    return await cache.aget(STATIONS_KEY, 24 * 3600, load, max_stale_s=7 * 24 * 3600, swr_s=24 * 3600)
+
+
+def _complexes(codes, meta):
+    """Group station codes into physical stations: ``[[A01, C01], [D01], ...]``,
+    in first-seen order, adding the other code of each transfer station."""
+    out, seen = [], {}
+    for code in codes:
+        if code in seen:
+            continue
+        other = (meta.get(code) or {}).get("together")
+        group = [code] + ([other] if other and other not in seen else [])
+        for c in group:
+            seen[c] = True
+        out.append(group)
+    return out
 
-def _nearest_rail_codes(config):
+
+async def _nearest_rail_codes(config):
     max_n = int(config.get("rail", {}).get("max_stations", 5))
-    meta = _stations_meta()
+    meta = await _stations_meta()
     home = config.get("home", {})
     lat = home.get("lat")
     lon = home.get("lon")
     radius = float(home.get("radius_m", 1200))
     if lat is None or lon is None:
         return []
-    within = []
-    all_dist = []
-    for code, m in meta.items():
-        if m.get("lat") is None or m.get("lon") is None:
-            continue
-        d = haversine_m(lat, lon, m["lat"], m["lon"])
-        all_dist.append((d, code))
-        if d <= radius:
-            within.append((d, code))
-    within.sort(key=lambda x: x[0])
+    idx = geo.index_for("rail", meta)
+    # A transfer station's two codes share coordinates; count it once
+    within = _complexes([code for _, code in idx.within(lat, lon, radius)], meta)
     if within:
-        return [code for _, code in within[:max_n]]
+        return [code for group in within[:max_n] for code in group]
     # Fallback: take nearest overall if none inside radius
-    all_dist.sort(key=lambda x: x[0])
-    return [code for _, code in all_dist[:max_n]]
+    nearest = _complexes([code for _, code in idx.nearest(lat, lon, 2 * max_n)], meta)
+    return [code for group in nearest[:max_n] for code in group]
 
 
-def rail_predictions(config):
+def _minutes_key(t):
+    m = t.minutes
+    if isinstance(m, int):
+        return m
+    return 0 if m in ("ARR", "BRD") else 999
+
+
+def _board(trains, per_direction):
+    """Sort by line, then direction (track group), then minutes, keeping the
+    next ``per_direction`` trains of each."""
+    trains = sorted(trains, key=lambda t: (t.line or "", t.group or "", _minutes_key(t)))
+    out, counts = [], {}
+    for t in trains:
+        k = (t.line, t.group)
+        counts[k] = counts.get(k, 0) + 1
+        if counts[k] <= per_direction:
+            out.append(t)
+    return out
+
+
+async def rail_predictions_async(config):
     key = os.getenv("WMATA_API_KEY", "")
     if not key:
         raise RuntimeError("WMATA_API_KEY not set")
-    favorites = config.get("rail", {}).get("favorites", []) or _nearest_rail_codes(config)
-    ttl = int(config.get("rail", {}).get("refresh_s", 15))
-    meta = _stations_meta() if favorites else {}
+    rail_cfg = config.get("rail", {})
+    favorites = list(rail_cfg.get("favorites", [])) or await _nearest_rail_codes(config)
+    if not favorites:
+        return {"stations": []}
+    ttl = int(rail_cfg.get("refresh_s", 15))
+    per_direction = int(rail_cfg.get("max_per_direction", 3))
+    meta = await _stations_meta()
+    complexes = _complexes(favorites, meta)
+    codes = sorted({c for group in complexes for c in group})
+    # Optionally race a second request when the first passes the recent p95
+    hedge = bool(rail_cfg.get("hedge", False))
 
-    stations = []
-    for code in favorites:
-        def load(code=code):
-            url = f"https://api.wmata.com/StationPrediction.svc/json/GetPrediction/{code}"
-            r = httpx.get(url, headers=_wmata_headers(), timeout=10)
-            r.raise_for_status()
-            trains = []
-            for t in r.json().get("Trains", []):
-                minutes = t.get("Min")
-                try:
-                    minutes = int(minutes)
-                except Exception:
-                    minutes = minutes or "--"
-                trains.append({
-                    "line": t.get("Line"),
-                    "dest": t.get("DestinationName"),
-                    "minutes": minutes,
-                    "cars": _safe_int(t.get("Car")),
-                })
-            return trains
-
-        arrivals = _cached(f"rail_{code}", ttl, load)
-        name = meta.get(code, {}).get("name") if meta else None
-        stations.append({"code": code, "name": name or code, "arrivals": arrivals})
+    async def load():
+        # GetPrediction takes a comma-separated list: one call for every station
+        url = f"{base_url('wmata')}/StationPrediction.svc/json/GetPrediction/{','.join(codes)}"
+        data = await get_json("wmata", url, priority="rail", hedge=hedge)
+        by_code = {c: [] for c in codes}
+        for t in data.get("Trains", []):
+            minutes = t.get("Min")
+            try:
+                minutes = int(minutes)
+            except Exception:
+                minutes = minutes or "--"
+            train = Train(t.get("Line"), t.get("DestinationName"), minutes, _safe_int(t.get("Car")), t.get("Group"))
+            if t.get("LocationCode") in by_code:
+                by_code[t.get("LocationCode")].append(train)
+        # Fresh for every station on this board, not only the stale ones,
+        # and for every worker when the cache is shared
+        for c, trains in by_code.items():
+            await cache.aput(f"rail_{c}", trains)
+        return by_code
 
+    batch = None
+
+    async def load_code(code):
+        # Each station is cached on its own, so profiles sharing a station
+        # share its entry; the stale ones of this board share one call
+        nonlocal batch
+        if batch is None:
+            batch = asyncio.ensure_future(load())
+        return (await batch)[code]
+
+    trains = await asyncio.gather(*(cache.aget(f"rail_{c}", ttl, lambda c=c: load_code(c)) for c in codes))
+    by_code = dict(zip(codes, trains))
+    stations = []
+    for group in complexes:
+        trains = [t for c in group for t in by_code.get(c, [])]
+        name = (meta.get(group[0]) or {}).get("name")
+        stations.append(RailStation(group[0], name or group[0], _board(trains, per_direction), group))
     return {"stations": stations}
 
 
+def rail_predictions(config):
+    return asyncio.run(rail_predictions_async(config))
+
+
 def _safe_int(x):
     try:
         return int(x)
@@ -110,7 +156,7 @@ def _safe_int(x):
         return None
 
 
-def bus_predictions(config):
+async def bus_predictions_async(config):
     key = os.getenv("WMATA_API_KEY", "")
     if not key:
         raise RuntimeError("WMATA_API_KEY not set")
@@ -126,57 +172,50 @@ def bus_predictions(config):
     if include_stations:
         radius_s = int(bus_cfg.get("include_near_radius_m", 250))
         per_station = int(bus_cfg.get("include_near_max_stops", 3))
-        meta = _stations_meta()
+        meta = await _stations_meta()
+        points = []
         for scode in include_stations:
             m = meta.get(scode)
-            if not m or m.get("lat") is None or m.get("lon") is None:
-                continue
-            lat_s, lon_s = m["lat"], m["lon"]
-            url = f"https://api.wmata.com/Bus.svc/json/jStops?lat={lat_s}&lon={lon_s}&radius={radius_s}"
-            rr = httpx.get(url, headers=_wmata_headers(), timeout=10)
-            rr.raise_for_status()
-            stops = rr.json().get("Stops", [])
-            stops_sorted = sorted(stops, key=lambda s: s.get("Distance", 999999))[:per_station]
-            for s in stops_sorted:
-                sid = s.get("StopID")
-                if sid is None:
-                    continue
-                sid = str(sid)
-                favorites.append(sid)
-                names_map[sid] = s.get("Name") or f"Stop {sid}"
+            if m and m.get("lat") is not None and m.get("lon") is not None:
+                points.append((scode, m["lat"], m["lon"]))
+
+        async def near(group):
+            # One jStops query covers every station in an overlapping group;
+            # each station then keeps its own closest stops.
+            lat_c, lon_c, cover = _covering_circle(group, radius_s)
+            found = await _stops_near(lat_c, lon_c, cover)
+            picks = []
+            for _, lat_s, lon_s in group:
+                ranked = []
+                for s in found:
+                    d = _stop_distance(s, lat_s, lon_s, len(group) == 1)
+                    if d <= radius_s:
+                        ranked.append((d, s))
+                ranked.sort(key=lambda x: x[0])
+                picks.extend(s for _, s in ranked[:per_station])
+            return picks
+
+        for picks in await asyncio.gather(*(near(g) for g in _merge_neighborhoods(points, radius_s))):
+            for s in picks:
+                favorites.append(s["id"])
+                names_map[s["id"]] = s["name"]
 
     # If still none, discover nearby stops via home lat/lon
     if not favorites:
-        # discover nearby stops via NextBus jStops
         home = config.get("home", {})
         lat = home.get("lat")
         lon = home.get("lon")
         radius = int(home.get("radius_m", 1200))
         if lat is not None and lon is not None:
-            def load_nb():
-                limit = int(config.get("bus", {}).get("max_stops", 3))
-                # Try increasing radius if none found; use Bus.svc for jStops (NextBus jStops is not available)
-                for rad in (radius, max(radius, 3000), max(radius, 5000)):
-                    url = f"https://api.wmata.com/Bus.svc/json/jStops?lat={lat}&lon={lon}&radius={rad}"
-                    rr = httpx.get(url, headers=_wmata_headers(), timeout=10)
-                    rr.raise_for_status()
-                    stops = rr.json().get("Stops", [])
-                    if stops:
-                        stops_sorted = sorted(stops, key=lambda s: s.get("Distance", 999999))[:limit]
-                        out = []
-                        for s in stops_sorted:
-                            sid = s.get("StopID")
-                            if sid is None:
-                                continue
-                            sid = str(sid)
-                            name = s.get("Name") or f"Stop {sid}"
-                            out.append((sid, name))
-                        return out
-                return []
-
-            favs = _cached("bus_nearby", 600, load_nb)
-            favorites = [sid for sid, _ in favs]
-            names_map = {sid: nm for sid, nm in favs}
+            limit = int(bus_cfg.get("max_stops", 3))
+            # Try increasing radius if none found; use Bus.svc for jStops (NextBus jStops is not available)
+            for rad in (radius, max(radius, 3000), max(radius, 5000)):
+                found = await _stops_near(lat, lon, rad)
+                if found:
+                    ranked = sorted(found, key=lambda s: s["distance"])[:limit]
+                    favorites = [s["id"] for s in ranked]
+                    names_map = {s["id"]: s["name"] for s in ranked}
+                    break
     # Deduplicate, preserve order
     seen = set()
     uniq_favs = []
@@ -185,41 +224,97 @@ def bus_predictions(config):
             seen.add(sid)
             uniq_favs.append(sid)
     favorites = uniq_favs
-    ttl = int(config.get("bus", {}).get("refresh_s", 20))
-    stops = []
-    max_arrivals = int(config.get("bus", {}).get("max_arrivals", 8))
-    for stop_id in favorites:
-        def load(stop_id=stop_id):
-            url = f"https://api.wmata.com/NextBusService.svc/json/jPredictions?StopID={stop_id}"
-            r = httpx.get(url, headers=_wmata_headers(), timeout=10)
-            r.raise_for_status()
+    ttl = int(bus_cfg.get("refresh_s", 20))
+    max_arrivals = int(bus_cfg.get("max_arrivals", 8))
+    # All stops are fetched together, but never more than this many at once
+    # (WMATA's default tier allows 10 calls/second per key)
+    limit = asyncio.Semaphore(max(1, int(bus_cfg.get("max_concurrency", 10))))
+
+    async def stop(stop_id):
+        async def load():
+            url = f"{base_url('wmata')}/NextBusService.svc/json/jPredictions?StopID={stop_id}"
+            async with limit:
+                data = await get_json("wmata", url, priority="bus")
             preds = []
-            for p in r.json().get("Predictions", []):
-                preds.append({
-                    "route": p.get("RouteID"),
-                    "headsign": p.get("DirectionText") or p.get("TripHeadsign"),
-                    "minutes": _safe_int(p.get("Minutes")),
-                })
-            name = (r.json().get("StopName") or f"Stop {stop_id}")
-            return {"name": name, "arrivals": preds[:max_arrivals]}
+            for p in data.get("Predictions", []):
+                preds.append(BusArrival(p.get("RouteID"), p.get("DirectionText") or p.get("TripHeadsign"),
+                                        _safe_int(p.get("Minutes"))))
+            return BusStop(stop_id, data.get("StopName"), preds)
 
-        entry = _cached(f"bus_{stop_id}", ttl, load)
-        nm = entry.get("name") or names_map.get(stop_id) or f"Stop {stop_id}"
-        stops.append({"id": stop_id, "name": nm, "arrivals": entry.get("arrivals", [])})
+        # Cached untrimmed: profiles sharing a stop may show different counts
+        entry = await cache.aget(f"bus_{stop_id}", ttl, load)
+        nm = entry.name or names_map.get(stop_id) or f"Stop {stop_id}"
+        return BusStop(stop_id, nm, entry.arrivals[:max_arrivals])
 
-    return {"stops": stops}
+    stops = await asyncio.gather(*(stop(stop_id) for stop_id in favorites))
+    return {"stops": list(stops)}
 
 
-def incidents(config):
+async def _stops_near(lat, lon, radius):
+    """jStops around a point, cached by (lat, lon, radius); stops rarely move."""
+    async def load():
+        url = f"{base_url('wmata')}/Bus.svc/json/jStops?lat={lat}&lon={lon}&radius={radius}"
+        out = []
+        for s in (await get_json("wmata", url, priority="bus")).get("Stops", []):
+            sid = s.get("StopID")
+            if sid is None:
+                continue
+            sid = str(sid)
+            out.append({
+                "id": sid,
+                "name": s.get("Name") or f"Stop {sid}",
+                "lat": s.get("Lat"),
+                "lon": s.get("Lon"),
+                "distance": s.get("Distance", 999999),
+            })
+        return out
+
+    key = f"busstops_{round(lat, 5)},{round(lon, 5)},{int(radius)}"
+    return await cache.aget(key, 24 * 3600, load, max_stale_s=7 * 24 * 3600, swr_s=24 * 3600)
+
+
+def _stop_distance(stop, lat, lon, centered):
+    # A query centred on this point already reports the distance
+    if centered or stop.get("lat") is None or stop.get("lon") is None:
+        return stop["distance"]
+    return haversine_m(lat, lon, stop["lat"], stop["lon"])
+
+
+def _merge_neighborhoods(points, radius):
+    """Group (code, lat, lon) points whose ``radius`` circles overlap."""
+    groups = []
+    for p in points:
+        touching = [g for g in groups if any(haversine_m(p[1], p[2], q[1], q[2]) <= 2 * radius for q in g)]
+        merged = [p]
+        for g in touching:
+            merged.extend(g)
+            groups.remove(g)
+        groups.append(merged)
+    return groups
+
+
+def _covering_circle(group, radius):
+    if len(group) == 1:
+        return group[0][1], group[0][2], radius
+    lat = sum(p[1] for p in group) / len(group)
+    lon = sum(p[2] for p in group) / len(group)
+    reach = max(haversine_m(lat, lon, p[1], p[2]) for p in group)
+    return round(lat, 6), round(lon, 6), int(reach + radius) + 1
+
+
+def bus_predictions(config):
+    return asyncio.run(bus_predictions_async(config))
+
+
+async def incidents_async(config):
     key = os.getenv("WMATA_API_KEY", "")
     if not key:
         raise RuntimeError("WMATA_API_KEY not set")
-    def load():
-        url = "https://api.wmata.com/Incidents.svc/json/Incidents"
-        r = httpx.get(url, headers=_wmata_headers(), timeout=10)
-        r.raise_for_status()
+    async def load():
+        url = f"{base_url('wmata')}/Incidents.svc/json/Incidents"
+        data = await get_json("wmata", url, priority="incidents")
         out = []
-        for i in r.json().get("Incidents", []):
+        for i in data.get("Incidents", []):
             out.append({
                 "type": i.get("IncidentType", "rail").lower(),
                 "severity": (i.get("Severity") or "info").lower(),
@@ -227,4 +322,8 @@ def incidents(config):
             })
         return out
 
-    return _cached("incidents", 60, load)
+    return await cache.aget("incidents", 60, load)
+
+
+def incidents(config):
+    return asyncio.run(incidents_async(config))
@@ -0,0 +1 @@
+"""Offline benchmarks for metro_clock; run as python -m bench.<name>."""
@@ -0,0 +1,245 @@
+"""Capacity report: how many kiosks one box can serve.
+
+Starts bench.stub and the app against it (like bench.summary), then adds
+simulated kiosks in steps. Each behaves like app.js: most hold a
+/v1/stream connection, the rest poll /v1/summary every --poll-s (10 s, with
+jitter) and revalidate with If-None-Match. A step passes while the polling
+p99, the app's event-loop lag p99 (from /metrics) and the error share stay
+under their limits; the ramp stops at the first step that fails.
+
+For each step it reports latency, loop lag, the app's CPU and RSS (total
+and per kiosk over the idle baseline) and upstream calls per minute, then
+the largest passing kiosk count:
+
+    ./capacity.sh --max 2000 --out capacity.json
+    python -m bench.capacity --start 50 --factor 1.5 --stream-share 0 --p99-ms 100
+
+The simulated kiosks share this process's event loop; with thousands of
+them, run the app on another core (or box) than the load generator.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.stub import StubServer, per_upstream  # noqa: E402
+from bench.summary import App, _children, _percentiles, _rss_kb, cold_start  # noqa: E402
+
+_LAG = re.compile(r'^metro_event_loop_lag_seconds_bucket\{le="([^"]+)"\} (\d+)$', re.M)
+
+
+def _cpu_s(pid):
+    """User + system CPU seconds of ``pid`` and its descendants."""
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="ascii") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    total = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return total + sum(_cpu_s(child) for child in _children(pid))
+
+
+def _lag_buckets(text):
+    return {le: int(n) for le, n in _LAG.findall(text)}
+
+
+def _lag_p99_ms(before, after):
+    """p99 loop lag between two scrapes, as the upper bound of its bucket."""
+    counts = [(float(le), after[le] - before.get(le, 0)) for le in after]
+    counts.sort()
+    total = counts[-1][1] if counts else 0
+    if not total:
+        return None
+    for le, n in counts:
+        if n >= total * 0.99:
+            return None if le == float("inf") else le * 1000
+    return None
+
+
+class Load:
+    """Simulated kiosks; results go to the current ``Window``."""
+
+    def __init__(self, url, poll_s, jitter):
+        self.url, self.poll_s, self.jitter = url, poll_s, jitter
+        self.tasks = []
+        self.window = Window()
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None), limits=limits)
+
+    def add(self, n, stream_share, rng):
+        for _ in range(n):
+            # Start offsets spread the new kiosks over one poll interval
+            offset = rng.uniform(0, self.poll_s)
+            run = self._stream if rng.random() < stream_share else self._poll
+            self.tasks.append(asyncio.create_task(run(offset, random.Random(rng.random()))))
+
+    async def _poll(self, offset, rng):
+        await asyncio.sleep(offset)
+        etag = None
+        while True:
+            t = time.perf_counter()
+            try:
+                r = await self.client.get(self.url + "/v1/summary",
+                                          headers={"If-None-Match": etag} if etag else None)
+                etag = r.headers.get("etag") or etag
+                self.window.done((time.perf_counter() - t) * 1000, str(r.status_code))
+            except httpx.HTTPError as e:
+                self.window.done(None, e.__class__.__name__)
+            await asyncio.sleep(self.poll_s * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    async def _stream(self, offset, rng):
+        await asyncio.sleep(offset)
+        while True:
+            try:
+                async with self.client.stream("GET", self.url + "/v1/stream") as r:
+                    if r.status_code != 200:
+                        self.window.done(None, str(r.status_code))
+                        await asyncio.sleep(self.poll_s)
+                        continue
+                    async for line in r.aiter_lines():
+                        if line.startswith("event: "):
+                            self.window.events += 1
+            except httpx.HTTPError as e:
+                self.window.done(None, e.__class__.__name__)
+            # EventSource reconnects after a dropped stream
+            await asyncio.sleep(3 * (1 + rng.uniform(0, self.jitter)))
+
+    async def close(self):
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.client.aclose()
+
+
+class Window:
+    def __init__(self):
+        self.times_ms = []
+        self.statuses = {}
+        self.events = 0
+
+    def done(self, ms, status):
+        if ms is not None:
+            self.times_ms.append(ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def errors(self):
+        return sum(n for s, n in self.statuses.items() if s not in ("200", "304"))
+
+
+async def _scrape(c, url):
+    return _lag_buckets((await c.get(url + "/metrics")).text)
+
+
+async def ramp(app, stub, args):
+    rng = random.Random(args.seed)
+    pid = app.proc.pid
+    load = Load(app.url, args.poll_s, args.jitter)
+    steps = []
+    async with httpx.AsyncClient(timeout=30.0) as c:
+        # Idle baseline: scheduler refreshes only
+        await asyncio.sleep(args.warmup_s)
+        base_rss = _rss_kb(pid) or 0
+        n, target = 0, args.start
+        try:
+            while target <= args.max:
+                load.add(target - n, args.stream_share, rng)
+                n = target
+                # Let every new kiosk connect and poll once before measuring
+                await asyncio.sleep(args.poll_s)
+                load.window = window = Window()
+                lag0, cpu0, calls0 = await _scrape(c, app.url), _cpu_s(pid), sum(stub.calls.values())
+                t0 = time.perf_counter()
+                await asyncio.sleep(args.step_s)
+                elapsed = time.perf_counter() - t0
+                lag_p99 = _lag_p99_ms(lag0, await _scrape(c, app.url))
+                cpu = (_cpu_s(pid) - cpu0) / elapsed
+                rss = _rss_kb(pid) or 0
+                requests = sum(window.statuses.values())
+                step = dict(
+                    _percentiles(window.times_ms),
+                    kiosks=n,
+                    statuses=window.statuses,
+                    stream_events=window.events,
+                    loop_lag_p99_ms=lag_p99,
+                    cpu_share=round(cpu, 3),
+                    cpu_share_per_kiosk=round(cpu / n, 5),
+                    rss_kb=rss,
+                    rss_kb_per_kiosk=round((rss - base_rss) / n, 1),
+                    upstream_calls_per_min=round((sum(stub.calls.values()) - calls0) * 60 / elapsed, 1),
+                )
+                failed = []
+                if step.get("p99_ms", 0) > args.p99_ms:
+                    failed.append("p99")
+                if lag_p99 is None or lag_p99 > args.lag_ms:
+                    failed.append("loop_lag")
+                if requests and window.errors() / requests > args.max_error_share:
+                    failed.append("errors")
+                step["failed"] = failed
+                steps.append(step)
+                print(json.dumps({k: v for k, v in step.items() if k != "statuses"}), file=sys.stderr)
+                if failed:
+                    break
+                target = max(target + 1, int(target * args.factor))
+        finally:
+            await load.close()
+    passed = [s for s in steps if not s["failed"]]
+    best = passed[-1] if passed else None
+    return {
+        "max_sustainable_kiosks": best["kiosks"] if best else 0,
+        "at_max": best and {k: best[k] for k in ("p99_ms", "loop_lag_p99_ms", "cpu_share_per_kiosk",
+                                                 "rss_kb_per_kiosk", "upstream_calls_per_min") if k in best},
+        "baseline_rss_kb": base_rss,
+        "steps": steps,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--start", type=int, default=10, help="kiosks in the first step")
+    ap.add_argument("--factor", type=float, default=2.0, help="kiosk multiplier per step")
+    ap.add_argument("--max", type=int, default=5000, help="stop ramping past this many kiosks")
+    ap.add_argument("--step-s", type=float, default=30.0, help="measured seconds per step")
+    ap.add_argument("--warmup-s", type=float, default=15.0, help="idle seconds before the first step")
+    ap.add_argument("--poll-s", type=float, default=10.0, help="app.js poll interval")
+    ap.add_argument("--jitter", type=float, default=0.1, help="poll interval jitter share")
+    ap.add_argument("--stream-share", type=float, default=0.8, help="kiosks on /v1/stream instead of polling")
+    ap.add_argument("--p99-ms", type=float, default=250.0, help="polling p99 limit")
+    ap.add_argument("--lag-ms", type=float, default=100.0, help="event-loop lag p99 limit")
+    ap.add_argument("--max-error-share", type=float, default=0.01)
+    ap.add_argument("--latency-ms", action="append", help="stub latency: MS or UPSTREAM=MS")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write JSON results to this path")
+    args = ap.parse_args(argv)
+
+    stub = StubServer(latency_ms=per_upstream(args.latency_ms)).start()
+    results = {"args": {k: v for k, v in vars(args).items() if k != "out"}}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = App(tmp, stub.env(), workers=args.workers)
+        try:
+            results["startup"] = cold_start(app)
+            if results["startup"]["complete_s"] is None:
+                raise SystemExit(f"app did not serve a complete summary: {results['startup']}")
+            results.update(asyncio.run(ramp(app, stub, args)))
+        finally:
+            app.stop()
+            stub.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(json.dumps({k: v for k, v in results.items() if k != "steps"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Nearest-station lookups: linear haversine scan vs backend.geo.GeoIndex.
+
+Builds a synthetic feed of --stations docks scattered around the DC area and
+runs the same radius and k-nearest queries both ways, checking the answers
+match. The linear scan is what wmata._nearest_rail_codes and
+bikeshare.bike_status used to do on every call.
+
+    python -m bench.geo_index --stations 50000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.geo import GeoIndex  # noqa: E402
+from backend.util import haversine_m  # noqa: E402
+
+CENTER = (38.8895, -77.0353)
+
+
+def _feed(n, rng):
+    # ~40 km x 40 km box around the Mall, like a large bikeshare system
+    return {
+        str(i): {"lat": CENTER[0] + rng.uniform(-0.18, 0.18), "lon": CENTER[1] + rng.uniform(-0.23, 0.23)}
+        for i in range(n)
+    }
+
+
+def _linear_within(meta, lat, lon, radius):
+    out = []
+    for key, m in meta.items():
+        d = haversine_m(lat, lon, m["lat"], m["lon"])
+        if d <= radius:
+            out.append((d, key))
+    out.sort(key=lambda x: x[0])
+    return out
+
+
+def _linear_nearest(meta, lat, lon, k):
+    out = [(haversine_m(lat, lon, m["lat"], m["lon"]), key) for key, m in meta.items()]
+    out.sort(key=lambda x: x[0])
+    return out[:k]
+
+
+def _time(fn, queries):
+    t0 = time.perf_counter()
+    results = [fn(*q) for q in queries]
+    return (time.perf_counter() - t0) * 1000 / len(queries), results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--stations", type=int, default=50000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--radius-m", type=float, default=800)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write JSON results to this path")
+    args = ap.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    meta = _feed(args.stations, rng)
+    points = [(CENTER[0] + rng.uniform(-0.15, 0.15), CENTER[1] + rng.uniform(-0.2, 0.2)) for _ in range(args.queries)]
+
+    t0 = time.perf_counter()
+    idx = GeoIndex((k, m["lat"], m["lon"]) for k, m in meta.items())
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    within_q = [(lat, lon, args.radius_m) for lat, lon in points]
+    nearest_q = [(lat, lon, args.k) for lat, lon in points]
+    lin_w_ms, lin_w = _time(lambda *q: _linear_within(meta, *q), within_q)
+    idx_w_ms, idx_w = _time(idx.within, within_q)
+    lin_n_ms, lin_n = _time(lambda *q: _linear_nearest(meta, *q), nearest_q)
+    idx_n_ms, idx_n = _time(idx.nearest, nearest_q)
+
+    same = all([k for _, k in a] == [k for _, k in b] for a, b in zip(lin_w, idx_w)) and \
+        all([k for _, k in a] == [k for _, k in b] for a, b in zip(lin_n, idx_n))
+    results = {
+        "stations": args.stations,
+        "queries": args.queries,
+        "build_ms": round(build_ms, 2),
+        "within": {"radius_m": args.radius_m, "linear_ms": round(lin_w_ms, 3), "index_ms": round(idx_w_ms, 3),
+                   "speedup": round(lin_w_ms / idx_w_ms, 1)},
+        "nearest": {"k": args.k, "linear_ms": round(lin_n_ms, 3), "index_ms": round(idx_n_ms, 3),
+                    "speedup": round(lin_n_ms / idx_n_ms, 1)},
+        "results_match": same,
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Compare one-shot httpx requests with the shared upstream pool.
+
+Runs a local stub server and issues the same sequence of GETs two ways:
+a fresh client per request (what the providers used to do) and a pooled
+keep-alive client from backend.upstream. --connect-delay-ms adds a pause to
+every newly accepted connection to model handshake round-trips on a real
+network; --tls serves HTTPS with a throwaway self-signed certificate.
+
+    python -m bench.http_pool --requests 200 --connect-delay-ms 30 --tls
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import upstream  # noqa: E402
+
+BODY = json.dumps({"Trains": [{"Line": "RD", "Min": "3"}] * 8}).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    connect_delay_s = 0.0
+    connections = 0
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        self.connections += 1
+        if self.connect_delay_s:
+            time.sleep(self.connect_delay_s)
+        return sock, addr
+
+
+def _self_signed(tmp):
+    cert, key = os.path.join(tmp, "cert.pem"), os.path.join(tmp, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+async def _run(url, n, pooled, verify):
+    times = []
+    if pooled:
+        client = upstream._new_client("wmata", verify=verify)
+    try:
+        for _ in range(n):
+            t0 = time.perf_counter()
+            if pooled:
+                r = await client.get(url)
+            else:
+                async with httpx.AsyncClient(verify=verify) as c:
+                    r = await c.get(url)
+            r.raise_for_status()
+            times.append((time.perf_counter() - t0) * 1000)
+    finally:
+        if pooled:
+            await client.aclose()
+    return times
+
+
+def _summary(times, connections):
+    times = sorted(times)
+    return {
+        "requests": len(times),
+        "connections": connections,
+        "mean_ms": round(statistics.fmean(times), 3),
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p99_ms": round(times[min(len(times) - 1, int(len(times) * 0.99))], 3),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--connect-delay-ms", type=float, default=0.0)
+    ap.add_argument("--tls", action="store_true")
+    ap.add_argument("--out", help="write JSON results to this path")
+    args = ap.parse_args(argv)
+
+    server = _Server(("127.0.0.1", 0), _Handler)
+    server.connect_delay_s = args.connect_delay_ms / 1000.0
+    scheme = "http"
+    verify = True
+    tmp = tempfile.TemporaryDirectory()
+    if args.tls:
+        cert, key = _self_signed(tmp.name)
+        sctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        sctx.load_cert_chain(cert, key)
+        server.socket = sctx.wrap_socket(server.socket, server_side=True)
+        verify = ssl.create_default_context(cafile=cert)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"{scheme}://localhost:{server.server_address[1]}/StationPrediction.svc/json/GetPrediction/A01"
+
+    results = {"tls": args.tls, "connect_delay_ms": args.connect_delay_ms}
+    for label, pooled in (("one_shot", False), ("pooled", True)):
+        before = server.connections
+        times = asyncio.run(_run(url, args.requests, pooled, verify))
+        results[label] = _summary(times, server.connections - before)
+    results["speedup"] = round(results["one_shot"]["mean_ms"] / results["pooled"]["mean_ms"], 2)
+    server.shutdown()
+    tmp.cleanup()
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
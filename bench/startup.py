@@ -0,0 +1,115 @@
+"""Startup profile: import cost of the app and time to first page and summary.
+
+- imports: wall time of ``import backend.app`` in a fresh interpreter, then of
+  the provider modules it loads once serving, with the slowest modules by
+  cumulative ``-X importtime``
+- boot: process launch to the first ``/`` response, to the first
+  ``/v1/summary`` response and to a summary with every section loaded,
+  against the local upstream stub (cold, then with persisted metadata)
+
+    python -m bench.startup
+    python -m bench.startup --latency-ms 300 --top 20 --out startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.stub import StubServer, per_upstream  # noqa: E402
+from bench.summary import App  # noqa: E402
+
+_TIMED_IMPORTS = """
+import importlib, json, time
+t = time.perf_counter()
+import backend.app as app
+out = {"backend.app": time.perf_counter() - t}
+t = time.perf_counter()
+for m in app.PROVIDER_MODULES:
+    importlib.import_module("backend." + m)
+out["providers"] = time.perf_counter() - t
+print(json.dumps(out))
+"""
+
+
+def imports(top):
+    """Import wall times (ms) and the ``top`` slowest modules by cumulative time."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _TIMED_IMPORTS], cwd=ROOT,
+                          env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True, check=True)
+    timed = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        modules.append((int(cumulative), name.strip()))
+    modules.sort(reverse=True)
+    return {
+        "backend_app_ms": round(timed["backend.app"] * 1000, 1),
+        "providers_ms": round(timed["providers"] * 1000, 1),
+        "slowest": [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in modules[:top]],
+    }
+
+
+def boot(app, timeout_s=60.0):
+    """Seconds from launch to the first page, first summary and complete summary."""
+    t0 = time.perf_counter()
+    app.start()
+    out = {"page_s": None, "first_summary_s": None, "complete_s": None}
+    with httpx.Client(timeout=5.0) as c:
+        while time.perf_counter() - t0 < timeout_s and out["complete_s"] is None:
+            path = "/" if out["page_s"] is None else "/v1/summary"
+            try:
+                r = c.get(app.url + path)
+            except httpx.TransportError:
+                time.sleep(0.01)
+                continue
+            now = round(time.perf_counter() - t0, 3)
+            if path == "/":
+                out["page_s"] = now if r.status_code == 200 else None
+                continue
+            if out["first_summary_s"] is None:
+                out["first_summary_s"] = now
+            if r.status_code == 200 and not r.json().get("errors"):
+                out["complete_s"] = now
+            else:
+                time.sleep(0.02)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    ap.add_argument("--latency-ms", action="append", help="stub latency: MS or UPSTREAM=MS")
+    ap.add_argument("--out", help="write JSON results to this path")
+    args = ap.parse_args(argv)
+
+    results = {"imports": imports(args.top)}
+    stub = StubServer(latency_ms=per_upstream(args.latency_ms)).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        app = App(tmp, stub.env())
+        try:
+            results["cold_boot"] = boot(app)
+            app.stop()
+            # Same data dir: station metadata and GBFS info come from disk
+            results["warm_boot"] = boot(app)
+        finally:
+            app.stop()
+            stub.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Local stand-in for WMATA, GBFS, Open-Meteo and weather.gov.
+
+Serves the recorded responses in bench/fixtures, re-stamped so they look
+current (GBFS last_updated, hourly forecast times), with optional latency
+and error injection. Point the app at it with the METRO_<UPSTREAM>_URL
+variables it prints:
+
+    python -m bench.stub --port 8900 --latency-ms 80 --error-rate 0.05
+
+With ``--replay DIR`` the rail and bus predictions and dock counts come from
+a history log the app recorded (``history.enabled``), played back from its
+first snapshot (``--replay-speed 60`` plays an hour a minute) and looped:
+
+    python -m bench.stub --replay data/history --replay-speed 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import history  # noqa: E402
+from backend.upstream import UPSTREAMS  # noqa: E402
+from backend.util import haversine_m  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES, name + ".json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _gbfs(doc):
+    now = int(time.time())
+    doc = dict(doc, last_updated=now)
+    stations = doc.get("data", {}).get("stations")
+    if stations is not None:
+        doc["data"] = dict(doc["data"], stations=[
+            dict(s, last_reported=now - 30) if "last_reported" in s else s for s in stations])
+    return doc
+
+
+def _hourly(doc):
+    # Recorded times start at 0; move them so the first hour is the previous one
+    start = (int(time.time()) // 3600 - 1) * 3600
+    hourly = dict(doc["hourly"], time=[start + t for t in doc["hourly"]["time"]])
+    return dict(doc, hourly=hourly)
+
+
+class Replay:
+    """A recorded history log played back ``speed`` times faster than it was
+    recorded, from its first snapshot, looping at the end."""
+
+    def __init__(self, path, since=0, until=None, speed=1.0):
+        self.timeline = history.Timeline(path, since, int(time.time()) if until is None else until)
+        self.speed = speed
+        self.t0 = time.time()
+
+    def _now(self):
+        tl = self.timeline
+        return tl.start + ((time.time() - self.t0) * self.speed) % (tl.end - tl.start + 1)
+
+    def state(self, kind):
+        """``{id: decoded}`` as of the current replay time."""
+        return {name.split(":", 1)[1]: history.decode(name, rows)
+                for name, rows in self.timeline.at(self._now(), kind).items()}
+
+    def trains(self, codes):
+        out = []
+        for code, snap in self.state("rail").items():
+            if "All" in codes or code in codes:
+                out.extend({"LocationCode": code, "Line": a["line"], "DestinationName": a["dest"],
+                            "Min": str(a["minutes"]), "Car": str(a["cars"]), "Group": a["group"]}
+                           for a in snap["arrivals"])
+        return out
+
+    def predictions(self, stop):
+        snap = self.state("bus").get(stop)
+        if snap is None:
+            return None
+        return {"StopName": None, "Predictions": [
+            {"RouteID": a["route"], "DirectionText": a["headsign"], "Minutes": a["minutes"]}
+            for a in snap["arrivals"]]}
+
+    def status(self, doc):
+        docks = self.state("bike")
+        stations = []
+        for s in doc["data"]["stations"]:
+            d = docks.get(s["station_id"])
+            if d:
+                s = dict(s, num_bikes_available=d["bikes"], num_docks_available=d["docks"],
+                         num_ebikes_available=d["ebikes"])
+            stations.append(s)
+        return dict(doc, data=dict(doc["data"], stations=stations))
+
+
+class Fixtures:
+    """Recorded responses, keyed by route, with the request-dependent parts
+    (station codes, stop ids, search radius) applied per request, and
+    predictions and dock counts from a Replay if one is given."""
+
+    def __init__(self, replay=None):
+        self.docs = {name[:-5]: _load(name[:-5]) for name in os.listdir(FIXTURES) if name.endswith(".json")}
+        self.replay = replay
+
+    def route(self, path):
+        """``(upstream, route)`` for a request path, or ``(None, None)``."""
+        if path.startswith("/gbfs/"):
+            return "gbfs", path.rsplit("/", 1)[-1][:-5]
+        if path == "/v1/forecast":
+            return "open_meteo", "forecast"
+        if path == "/alerts/active":
+            return "nws", "alerts"
+        for route in ("jStations", "GetPrediction", "jPredictions", "jStops", "Incidents"):
+            if f"/{route}" in path:
+                return "wmata", route
+        return None, None
+
+    def respond(self, upstream, route, path, query, base):
+        d = self.docs
+        if route == "GetPrediction":
+            codes = set(path.rsplit("/", 1)[-1].split(","))
+            if self.replay is not None:
+                return {"Trains": self.replay.trains(codes)}
+            trains = d["wmata_GetPrediction"]["Trains"]
+            return {"Trains": [t for t in trains if "All" in codes or t["LocationCode"] in codes]}
+        if route == "jPredictions":
+            stop = query.get("StopID", [""])[0]
+            replayed = self.replay.predictions(stop) if self.replay is not None else None
+            return replayed or d["wmata_jPredictions"].get(stop) or {"StopName": None, "Predictions": []}
+        if route == "jStops":
+            lat, lon = float(query["lat"][0]), float(query["lon"][0])
+            radius = float(query.get("radius", ["500"])[0])
+            out = []
+            for s in d["wmata_jStops"]["Stops"]:
+                dist = haversine_m(lat, lon, s["Lat"], s["Lon"])
+                if dist <= radius:
+                    out.append(dict(s, Distance=round(dist)))
+            return {"Stops": out}
+        if route == "forecast":
+            return _hourly(d["open_meteo_hourly"]) if "hourly" in query else d["open_meteo_current"]
+        if route == "gbfs":
+            return json.loads(json.dumps(_gbfs(d["gbfs_gbfs"])).replace("{base}", base))
+        key = f"{upstream}_{route}"
+        if key not in d:
+            return None
+        if key == "gbfs_station_status" and self.replay is not None:
+            return _gbfs(self.replay.status(d[key]))
+        return _gbfs(d[key]) if upstream == "gbfs" else d[key]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        srv = self.server
+        parts = urlsplit(self.path)
+        upstream, route = srv.fixtures.route(parts.path)
+        srv.calls[f"{upstream}:{route}"] += 1
+        delay_ms = srv.latency_ms.get(upstream, srv.latency_ms.get("*", 0.0))
+        if delay_ms or srv.jitter_ms:
+            time.sleep(max(0.0, delay_ms + srv.rng.uniform(-srv.jitter_ms, srv.jitter_ms)) / 1000.0)
+        doc = None
+        if upstream is not None and srv.rng.random() >= srv.error_rate.get(upstream, srv.error_rate.get("*", 0.0)):
+            base = f"http://{self.headers.get('Host')}"
+            doc = srv.fixtures.respond(upstream, route, parts.path, parse_qs(parts.query), base)
+            status = 200 if doc is not None else 404
+        else:
+            status = 404 if upstream is None else 503
+        body = json.dumps(doc if doc is not None else {"error": status}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """``latency_ms`` and ``error_rate`` map an upstream name (or ``"*"``) to
+    milliseconds added per request / the share of requests answered 503."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=None, jitter_ms=0.0, error_rate=None, seed=1, replay=None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.fixtures = Fixtures(replay)
+        self.latency_ms = dict(latency_ms or {})
+        self.jitter_ms = jitter_ms
+        self.error_rate = dict(error_rate or {})
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def env(self):
+        return {f"METRO_{name.upper()}_URL": self.url for name in UPSTREAMS}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def per_upstream(values):
+    """Parse ``["80", "nws=2000"]`` into ``{"*": 80.0, "nws": 2000.0}``."""
+    out = {}
+    for v in values or ():
+        name, _, num = v.rpartition("=")
+        out[name or "*"] = float(num)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--latency-ms", action="append", help="MS or UPSTREAM=MS (repeatable)")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", action="append", help="RATE or UPSTREAM=RATE (repeatable)")
+    ap.add_argument("--replay", help="history log directory to play back")
+    ap.add_argument("--replay-since", type=int, default=0, help="first epoch second to replay")
+    ap.add_argument("--replay-speed", type=float, default=1.0)
+    args = ap.parse_args(argv)
+    replay = Replay(args.replay, args.replay_since, speed=args.replay_speed) if args.replay else None
+    server = StubServer(args.port, per_upstream(args.latency_ms), args.jitter_ms, per_upstream(args.error_rate),
+                        replay=replay)
+    for k, v in server.env().items():
+        print(f"export {k}={v}")
+    print("export WMATA_API_KEY=bench")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
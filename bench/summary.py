@@ -0,0 +1,260 @@
+"""End-to-end /v1/summary benchmarks against the local upstream stub.
+
+Starts bench.stub, launches the app under uvicorn in a subprocess pointed at
+it (METRO_*_URL), and measures:
+
+- cold start: process launch to the first summary with every section loaded,
+  then again with the persisted metadata from the first run (warm restart)
+- latency: sequential full and conditional (If-None-Match) requests, p50/p99
+- kiosks: N concurrent clients polling as fast as they can (or every
+  --poll-s), throughput and latency
+- memory: the app's RSS sampled over the whole run
+- upstream calls made by the app, per route
+
+Nothing touches the network, so results are comparable between commits:
+
+    python -m bench.summary --kiosks 20 --duration 10 --out results.json
+    python -m bench.summary --latency-ms 150 --error-rate nws=0.5
+    python -m bench.summary --replay data/history --replay-speed 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.stub import Replay, StubServer, per_upstream  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r", encoding="ascii") as f:
+            return [int(c) for c in f.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_kb(pid):
+    """RSS of ``pid`` plus its descendants (uvicorn --workers forks them)."""
+    total = None
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total = int(line.split()[1])
+    except OSError:
+        return None
+    for child in _children(pid):
+        total += _rss_kb(child) or 0
+    return total
+
+
+def _percentiles(times_ms):
+    if not times_ms:
+        return {"requests": 0}
+    times_ms = sorted(times_ms)
+    return {
+        "requests": len(times_ms),
+        "mean_ms": round(statistics.fmean(times_ms), 3),
+        "p50_ms": round(times_ms[len(times_ms) // 2], 3),
+        "p99_ms": round(times_ms[min(len(times_ms) - 1, int(len(times_ms) * 0.99))], 3),
+        "max_ms": round(times_ms[-1], 3),
+    }
+
+
+class App:
+    """The app under uvicorn in its own process, with its own config and data dir."""
+
+    def __init__(self, workdir, env, config=None, workers=1):
+        self.workdir = workdir
+        self.workers = workers
+        self.env = dict(os.environ, PYTHONPATH=ROOT, METRO_DATA_DIR=os.path.join(workdir, "data"),
+                        WMATA_API_KEY="bench", **env)
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        with open(os.path.join(workdir, "config.yaml"), "w", encoding="utf-8") as f:
+            json.dump(config or {}, f)     # JSON is valid YAML
+        self.proc = None
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.app:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning", "--workers", str(self.workers)],
+            cwd=self.workdir, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        return self
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
+
+
+def cold_start(app, timeout_s=60.0):
+    """Seconds from launch to the first response, and to a summary with no errors."""
+    t0 = time.perf_counter()
+    app.start()
+    first = None
+    with httpx.Client(timeout=5.0) as c:
+        while time.perf_counter() - t0 < timeout_s:
+            try:
+                r = c.get(app.url + "/v1/summary")
+            except httpx.TransportError:
+                time.sleep(0.02)
+                continue
+            if first is None:
+                first = time.perf_counter() - t0
+            if r.status_code == 200 and not r.json().get("errors"):
+                return {"first_response_s": round(first, 3), "complete_s": round(time.perf_counter() - t0, 3)}
+            time.sleep(0.02)
+    return {"first_response_s": first and round(first, 3), "complete_s": None,
+            "errors": r.json().get("errors") if first else "no response"}
+
+
+def latency(url, n):
+    full, conditional = [], []
+    with httpx.Client(timeout=30.0) as c:
+        etag = None
+        for _ in range(n):
+            t = time.perf_counter()
+            r = c.get(url + "/v1/summary")
+            full.append((time.perf_counter() - t) * 1000)
+            etag = r.headers.get("etag")
+        for _ in range(n):
+            t = time.perf_counter()
+            c.get(url + "/v1/summary", headers={"If-None-Match": etag} if etag else None)
+            conditional.append((time.perf_counter() - t) * 1000)
+    return {"full": _percentiles(full), "conditional": _percentiles(conditional)}
+
+
+async def kiosks(url, n, duration_s, poll_s):
+    """``n`` clients behaving like app.js (ETag revalidation) for ``duration_s``."""
+    times, statuses = [], {}
+    deadline = time.perf_counter() + duration_s
+    limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+
+    async def client(c, i):
+        etag = None
+        if poll_s:
+            await asyncio.sleep(poll_s * i / n)     # spread the kiosks over one interval
+        while time.perf_counter() < deadline:
+            t = time.perf_counter()
+            try:
+                r = await c.get(url + "/v1/summary", headers={"If-None-Match": etag} if etag else None)
+                etag = r.headers.get("etag") or etag
+                key = str(r.status_code)
+            except httpx.HTTPError as e:
+                key = e.__class__.__name__
+            times.append((time.perf_counter() - t) * 1000)
+            statuses[key] = statuses.get(key, 0) + 1
+            if poll_s:
+                await asyncio.sleep(poll_s)
+
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as c:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(c, i) for i in range(n)))
+        elapsed = time.perf_counter() - started
+    return dict(_percentiles(times), kiosks=n, statuses=statuses,
+                throughput_rps=round(len(times) / elapsed, 1))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, pid, every_s):
+        super().__init__(daemon=True)
+        self.pid, self.every_s = pid, every_s
+        self.t0 = time.perf_counter()
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            rss = _rss_kb(self.pid)
+            if rss is not None:
+                self.samples.append([round(time.perf_counter() - self.t0, 2), rss])
+            self.stopped.wait(self.every_s)
+
+    def result(self):
+        rss = [s[1] for s in self.samples]
+        if not rss:
+            return {}
+        return {"start_kb": rss[0], "end_kb": rss[-1], "peak_kb": max(rss), "samples": self.samples}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--requests", type=int, default=200, help="sequential requests per latency pass")
+    ap.add_argument("--kiosks", type=int, default=20)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds of concurrent polling")
+    ap.add_argument("--poll-s", type=float, default=0.0, help="per-kiosk poll interval (0 = back to back)")
+    ap.add_argument("--latency-ms", action="append", help="stub latency: MS or UPSTREAM=MS")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", action="append", help="stub 503 share: RATE or UPSTREAM=RATE")
+    ap.add_argument("--no-scheduler", action="store_true", help="build summaries live per request")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--shared-cache", action="store_true", help="share the provider cache between workers")
+    ap.add_argument("--replay", help="drive the stub from a recorded history log directory")
+    ap.add_argument("--replay-speed", type=float, default=1.0)
+    ap.add_argument("--sample-s", type=float, default=0.5, help="RSS sampling interval")
+    ap.add_argument("--out", help="write JSON results to this path")
+    args = ap.parse_args(argv)
+
+    stub = StubServer(latency_ms=per_upstream(args.latency_ms), jitter_ms=args.jitter_ms,
+                      error_rate=per_upstream(args.error_rate),
+                      replay=Replay(args.replay, speed=args.replay_speed) if args.replay else None).start()
+    config = {"scheduler": {"enabled": not args.no_scheduler}, "cache": {"shared": args.shared_cache}}
+    results = {"args": {k: v for k, v in vars(args).items() if k != "out"}}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = App(tmp, stub.env(), config, workers=args.workers)
+        try:
+            results["cold_start"] = cold_start(app)
+            app.stop()
+            # Same data dir: station metadata and GBFS info come from disk
+            results["warm_restart"] = cold_start(app)
+            sampler = _Sampler(app.proc.pid, args.sample_s)
+            sampler.start()
+            calls_before = sum(stub.calls.values())
+            t0 = time.perf_counter()
+            results["latency"] = latency(app.url, args.requests)
+            results["kiosks"] = asyncio.run(kiosks(app.url, args.kiosks, args.duration, args.poll_s))
+            minutes = (time.perf_counter() - t0) / 60.0
+            sampler.stopped.set()
+            sampler.join()
+            results["memory"] = sampler.result()
+            results["upstream"] = {
+                "calls_by_route": dict(sorted(stub.calls.items())),
+                "calls_per_min_under_load": round((sum(stub.calls.values()) - calls_before) / minutes, 1),
+            }
+        finally:
+            app.stop()
+            stub.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    summary = dict(results, memory={k: v for k, v in results.get("memory", {}).items() if k != "samples"})
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
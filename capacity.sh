@@ -0,0 +1,15 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Capacity report: ramps simulated kiosks against the app on stubbed
+# providers (no network, no API key) until latency or event-loop lag
+# crosses its limit. Options: python -m bench.capacity --help
+DIR="$(cd "$(dirname "$0")" && pwd)"
+cd "$DIR"
+
+if [[ -d .venv ]]; then
+  # shellcheck disable=SC1091
+  source .venv/bin/activate
+fi
+
+exec python -m bench.capacity "$@"
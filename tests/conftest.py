@@ -0,0 +1,57 @@
+import httpx
+import pytest
+
+from backend import store
+from backend.cache import Cache
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A fresh store directory, restored afterwards."""
+    old = store._dir
+    store.configure(str(tmp_path))
+    yield tmp_path
+    store.configure(old)
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    """Swap the provider modules' shared cache for an empty one."""
+    from backend import bikeshare, weather, wmata
+    c = Cache()
+    for mod in (bikeshare, weather, wmata):
+        monkeypatch.setattr(mod, "cache", c)
+    return c
+
+
+class Upstream:
+    """Stands in for backend.upstream.get: answers from ``routes`` (a path
+    fragment -> JSON body, or callable of the URL) and records every URL."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    async def get(self, upstream, url, headers=None, timeout=None, priority=None, hedge=False):
+        self.calls.append(url)
+        for fragment, body in self.routes.items():
+            if fragment in url:
+                body = body(url) if callable(body) else body
+                return httpx.Response(200, json=body, request=httpx.Request("GET", url))
+        return httpx.Response(404, json={}, request=httpx.Request("GET", url))
+
+    async def get_json(self, upstream, url, **kwargs):
+        return (await self.get(upstream, url, **kwargs)).json()
+
+    def count(self, fragment):
+        return sum(fragment in url for url in self.calls)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Install an ``Upstream`` with no routes; tests fill ``.routes``."""
+    from backend import upstream as real, wmata
+    fake = Upstream({})
+    monkeypatch.setattr(real, "get", fake.get)
+    monkeypatch.setattr(wmata, "get_json", fake.get_json)
+    return fake
@@ -0,0 +1,135 @@
+import asyncio
+
+from backend import app, scheduler as scheduler_mod
+from backend.scheduler import Job, Scheduler
+
+
+class FakeScheduler:
+    def __init__(self, name):
+        self.name = name
+        self.running = False
+        self.refreshed = []
+
+    def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+    def refresh_now(self, jobs):
+        self.refreshed.append(jobs)
+
+
+def test_disabling_the_scheduler_stops_running_ones(monkeypatch):
+    monkeypatch.setattr(app, "schedulers", {})
+    monkeypatch.setattr(app, "_apply_limits", lambda cfg: None)
+    monkeypatch.setattr(app, "_new_scheduler", FakeScheduler)
+    on = {"scheduler": {"enabled": True}, "profiles": {"kitchen": {}}}
+    off = {"scheduler": {"enabled": False}, "profiles": {"kitchen": {}}}
+
+    async def main():
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        monkeypatch.setattr(app, "_booting", done)
+        app._on_config_change({}, on)
+        running = dict(app.schedulers)
+        assert set(running) == {"default", "kitchen"}
+        assert all(s.running for s in running.values())
+
+        app._on_config_change(on, off)
+        await asyncio.sleep(0)
+        assert app.schedulers == {}
+        assert not any(s.running for s in running.values())
+
+        app._on_config_change(off, on)
+        assert set(app.schedulers) == {"default", "kitchen"}
+
+    asyncio.run(main())
+
+
+def test_config_changes_during_startup_leave_scheduling_to_boot(monkeypatch):
+    monkeypatch.setattr(app, "schedulers", {})
+    applied = []
+    monkeypatch.setattr(app, "_apply_limits", applied.append)
+    monkeypatch.setattr(app, "_booting", None)
+    new = {"scheduler": {"enabled": True}}
+    app._on_config_change({}, new)
+    assert applied == [new]
+    assert app.schedulers == {}
+
+
+def test_fetched_at_follows_each_sections_last_fetch(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(scheduler_mod.time, "time", lambda: clock[0])
+    values = {key: fallback for key, _, _, fallback, _, _ in app.SECTIONS}
+    values["rail"] = {"stations": ["A01 in 3"]}
+    values["bus"] = {"stops": ["1001 in 5"]}
+
+    def job(key):
+        async def run(cfg):
+            return values[key]
+        return Job(key, run, lambda cfg, value: 30, stamped=key in ("rail", "bus"))
+
+    async def main():
+        sched = Scheduler([job(key) for key, *_ in app.SECTIONS], lambda: {})
+        for j in sched.jobs.values():
+            await sched.refresh(j, {})
+        first = (await app.build_summary({}, sched))["fetched_at"]
+
+        clock[0] = 1030.0
+        values["rail"] = {"stations": ["A01 in 2"]}
+        values["bus"] = dict(values["bus"])     # equal value, new object
+        for j in sched.jobs.values():
+            await sched.refresh(j, {})
+        # An unchanged refresh still moves the version, so the page is sent the new time
+        version = sched.version
+        clock[0] = 1040.0
+        await sched.refresh(sched.jobs["bus"], {})
+        assert sched.version > version
+        return first, (await app.build_summary({}, sched))["fetched_at"]
+
+    # Summaries read job values only from a running scheduler
+    monkeypatch.setattr(Scheduler, "running", property(lambda self: True))
+    first, second = asyncio.run(main())
+    assert first == {"rail": 1000, "bus": 1000}
+    assert second == {"rail": 1030, "bus": 1040}
+
+
+class OpenRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_disabling_the_scheduler_ends_open_streams(monkeypatch):
+    monkeypatch.setattr(app, "schedulers", {})
+    monkeypatch.setattr(app, "_encoded", {})
+    monkeypatch.setattr(app, "_apply_limits", lambda cfg: None)
+    builds = []
+    build = app._build
+    monkeypatch.setattr(app, "_build", lambda *a, **kw: builds.append(a) or build(*a, **kw))
+
+    async def run(cfg):
+        return []
+
+    async def main():
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        monkeypatch.setattr(app, "_booting", done)
+        sched = Scheduler([Job(key, run, lambda cfg, value: 30) for key, *_ in app.SECTIONS], lambda: {})
+        app.schedulers["default"] = sched
+        sched.start()
+        response = await app.stream(OpenRequest(), "default")
+        events = response.body_iterator
+        assert (await events.__anext__()).startswith(b"event: snapshot")
+
+        app._on_config_change({}, {"scheduler": {"enabled": False}})
+        rest = await asyncio.wait_for(_drain(events), 2)
+        assert rest == []
+        assert len(builds) <= 1
+        assert not sched.running
+
+    asyncio.run(main())
+
+
+async def _drain(events):
+    return [chunk async for chunk in events]
@@ -0,0 +1,52 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from backend import bikeshare
+
+
+def _doc(updated, bikes):
+    return json.dumps({"last_updated": updated, "ttl": 0, "data": {"stations": [
+        {"station_id": "d1", "last_reported": updated, "num_bikes_available": bikes, "num_docks_available": 3},
+    ]}}).encode()
+
+
+def test_polls_never_change_a_cached_table_in_place(fresh_cache, monkeypatch):
+    docs = [_doc(100, 5), _doc(200, 2)]
+
+    async def feeds():
+        return {"station_status": "https://gbfs.example/station_status.json"}
+
+    class Body:
+        async def aiter_bytes(self):
+            yield docs.pop(0)
+
+    @asynccontextmanager
+    async def stream(upstream, url):
+        yield Body()
+
+    monkeypatch.setattr(bikeshare, "_gbfs_feeds", feeds)
+    monkeypatch.setattr(bikeshare, "stream", stream)
+
+    async def main():
+        first = await bikeshare._station_status(60)
+        fresh_cache.put("gbfs_status", first, fetched_at=0)
+        second = await bikeshare._station_status(60)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first.get("d1")["bikes"] == 5 and first.last_updated == 100
+    assert second.get("d1")["bikes"] == 2 and second.last_updated == 200
+
+
+def test_the_feed_ttl_short_circuit_follows_the_cached_table(fresh_cache, monkeypatch):
+    async def feeds():
+        raise AssertionError("no fetch while the cached table is fresh")
+
+    monkeypatch.setattr(bikeshare, "_gbfs_feeds", feeds)
+    # As adopted from another worker through the shared cache
+    other = bikeshare.StatusTable()
+    other.apply({"station_id": "d1", "last_reported": 100, "num_bikes_available": 4})
+    other.fresh_until = 2**40
+    fresh_cache.put("gbfs_status", other, fetched_at=0)
+    assert asyncio.run(bikeshare._station_status(60)) is other
@@ -0,0 +1,34 @@
+import threading
+import time
+
+from backend.cache import Cache
+
+
+def test_sync_get_shares_one_load_across_threads():
+    c = Cache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(c.get("rail_A01", 30, loader))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert got == ["value"] * 4
+    assert len(calls) == 1
+    assert c.peek("rail_A01") == "value"
+
+
+def test_invalidate_by_prefix():
+    c = Cache()
+    c.put("rail_A01", 1)
+    c.put("rail_C01", 2)
+    c.put("bus_1001", 3)
+    c.invalidate(prefix="rail_")
+    assert c.peek("rail_A01") is None and c.peek("rail_C01") is None
+    assert c.peek("bus_1001") == 3
@@ -0,0 +1,38 @@
+import random
+import time
+
+from backend.geo import GeoIndex
+from backend.util import haversine_m
+
+
+def _points(n=500, seed=1):
+    rng = random.Random(seed)
+    # Scattered around Washington, DC
+    return [(f"s{i}", 38.9 + rng.uniform(-0.2, 0.2), -77.03 + rng.uniform(-0.25, 0.25)) for i in range(n)]
+
+
+def _brute(points, lat, lon, k):
+    return sorted(haversine_m(lat, lon, p_lat, p_lon) for _, p_lat, p_lon in points)[:k]
+
+
+def test_nearest_matches_brute_force():
+    points = _points()
+    idx = GeoIndex(points)
+    for lat, lon in ((38.9, -77.03), (38.75, -77.2), (39.05, -76.85)):
+        got = [d for d, _ in idx.nearest(lat, lon, 5)]
+        assert got == _brute(points, lat, lon, 5)
+
+
+def test_nearest_far_outside_the_data_is_fast():
+    points = _points()
+    idx = GeoIndex(points)
+    for lat, lon in ((0.0, 0.0), (39.95, -75.16), (37.54, -77.44), (-33.9, 151.2)):
+        start = time.perf_counter()
+        got = idx.nearest(lat, lon, 10)
+        assert time.perf_counter() - start < 0.5
+        assert [d for d, _ in got] == _brute(points, lat, lon, 10)
+
+
+def test_nearest_with_k_above_size():
+    points = _points(20)
+    assert len(GeoIndex(points).nearest(38.9, -77.03, 50)) == 20
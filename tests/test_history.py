@@ -0,0 +1,75 @@
+import os
+import time
+
+from backend import history
+from backend.models import BusArrival, BusStop, Dock, RailStation, Train
+
+
+def _rail(code, minutes):
+    return {"stations": [RailStation(code, code, [Train("RD", "Glenmont", minutes, 8, "1")], [code])]}
+
+
+def _record(path, pid, monkeypatch, items):
+    monkeypatch.setattr(os, "getpid", lambda: pid)
+    rec = history.Recorder()
+    rec.configure(enabled=True, dir=str(path))
+    for kind, value, t in items:
+        rec.record(kind, value, t)
+    rec.close()
+
+
+def test_round_trip_keeps_only_changes(tmp_path, monkeypatch):
+    t0 = int(time.time()) - 600
+    _record(tmp_path, 1, monkeypatch, [
+        ("rail", _rail("A01", "ARR"), t0),
+        ("rail", _rail("A01", "ARR"), t0 + 15),
+        ("rail", {"stations": [RailStation("A01", "A01", [], ["A01"])]}, t0 + 30),
+        ("bus", {"stops": [BusStop("1001", "Stop", [BusArrival("70", "North", 12)])]}, t0 + 31),
+        ("bike", {"stations": [Dock("d1", "Dock", 3, 9, 1)]}, t0 + 32),
+    ])
+    rail = history.query(str(tmp_path), "rail:A01", t0, t0 + 60)
+    assert [(s["t"], [a["minutes"] for a in s["arrivals"]]) for s in rail] == [(t0, ["ARR"]), (t0 + 30, [])]
+    assert history.query(str(tmp_path), "bus:1001", t0, t0 + 60)[0]["arrivals"][0]["route"] == "70"
+    assert history.query(str(tmp_path), "bike:d1", t0, t0 + 60)[0]["bikes"] == 3
+
+
+def test_workers_write_their_own_files_and_scans_merge_them(tmp_path, monkeypatch):
+    t0 = int(time.time()) - 600
+    # Each worker meets the stations in a different order, so their ids differ
+    _record(tmp_path, 101, monkeypatch, [("rail", _rail("A01", 5), t0), ("rail", _rail("D01", 7), t0 + 20)])
+    _record(tmp_path, 102, monkeypatch, [("rail", _rail("D01", 7), t0 + 10), ("rail", _rail("A01", 3), t0 + 30)])
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".rows")]) == 2
+    a01 = history.query(str(tmp_path), "rail:A01", t0, t0 + 60)
+    assert [(s["t"], s["arrivals"][0]["minutes"]) for s in a01] == [(t0, 5), (t0 + 30, 3)]
+    # The same D01 snapshot from both workers is reported once
+    d01 = history.query(str(tmp_path), "rail:D01", t0, t0 + 60)
+    assert [(s["t"], s["arrivals"][0]["minutes"]) for s in d01] == [(t0 + 10, 7)]
+
+
+def test_a_partial_string_from_a_crash_is_dropped_on_reopen(tmp_path, monkeypatch):
+    t0 = int(time.time()) - 600
+    _record(tmp_path, 1, monkeypatch, [("rail", _rail("A01", 5), t0)])
+    strings = next(n for n in os.listdir(tmp_path) if n.endswith(".strings"))
+    with open(tmp_path / strings, "a", encoding="utf-8") as f:
+        f.write('"rail:D0')
+    _record(tmp_path, 1, monkeypatch, [("rail", _rail("D01", 7), t0 + 10), ("rail", _rail("A01", 3), t0 + 20)])
+    assert (tmp_path / strings).read_text(encoding="utf-8").endswith("\n")
+    d01 = history.query(str(tmp_path), "rail:D01", t0, t0 + 60)
+    assert [(s["t"], s["arrivals"][0]["dest"]) for s in d01] == [(t0 + 10, "Glenmont")]
+    a01 = history.query(str(tmp_path), "rail:A01", t0, t0 + 60)
+    assert [(s["t"], s["arrivals"][0]["minutes"]) for s in a01] == [(t0, 5), (t0 + 20, 3)]
+
+
+def test_disabling_with_snapshots_queued_keeps_the_writer_usable(tmp_path):
+    t0 = int(time.time()) - 600
+    rec = history.Recorder()
+    rec.configure(enabled=True, dir=str(tmp_path))
+    rec.configure(enabled=False)
+    # A snapshot recorded just before the reload reaches the writer after it
+    rec._queue.put((t0, history.snapshot("rail", _rail("A01", 5))))
+    while not rec._queue.empty():
+        time.sleep(0.01)
+    rec.configure(enabled=True, dir=str(tmp_path))
+    rec.record("rail", _rail("D01", 7), t0 + 10)
+    rec.close()
+    assert [s["t"] for s in history.query(str(tmp_path), "rail:D01", t0, t0 + 60)] == [t0 + 10]
@@ -0,0 +1,42 @@
+import calendar
+import time
+
+import pytest
+
+from backend import config, policy
+
+
+def _utc(*parts):
+    return calendar.timegm(parts + (0, 0, 0))
+
+
+@pytest.fixture
+def utc_host(monkeypatch):
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_rail_hours_follow_washington_time_on_a_utc_host(utc_host):
+    # Friday 22:30 UTC is 18:30 in Washington: evening rush
+    assert policy.rail_open(_utc(2026, 10, 16, 22, 30, 0))
+    # Tuesday 06:00 UTC is 02:00 in Washington, after Monday's midnight close
+    assert not policy.rail_open(_utc(2026, 10, 13, 6, 0, 0))
+    # Saturday 04:30 UTC is 00:30 in Washington, inside Friday's late close
+    assert policy.rail_open(_utc(2026, 10, 17, 4, 30, 0))
+
+
+def test_closed_factor_uses_the_configured_zone(utc_host):
+    cfg = {"adaptive": dict(config.DEFAULT_CONFIG["adaptive"])}
+    rush = _utc(2026, 10, 16, 22, 30, 0)
+    assert policy.factor("incidents", [], cfg, rush) == 1.0
+    cfg["adaptive"]["tz"] = "Asia/Kolkata"     # 04:00 Saturday there
+    assert policy.factor("incidents", [], cfg, rush) == cfg["adaptive"]["closed_factor"]
+
+
+def test_unknown_zone_is_rejected():
+    cfg = config._merge(config.DEFAULT_CONFIG, {"adaptive": {"tz": "Mars/Olympus"}})
+    with pytest.raises(ValueError, match="adaptive.tz"):
+        config.validate(cfg)
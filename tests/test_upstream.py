@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend import breaker, upstream
+
+
+@pytest.fixture
+def mock_pool(monkeypatch):
+    """Pooled clients answered by ``handler(request)``; breakers start fresh."""
+    monkeypatch.setattr(breaker, "breakers", {})
+    handler = {"fn": lambda request: httpx.Response(200)}
+
+    async def install():
+        await upstream.close_pool()
+        transport = httpx.MockTransport(lambda request: handler["fn"](request))
+        for name in breaker.UPSTREAMS:
+            upstream._clients[name] = httpx.AsyncClient(transport=transport)
+        monkeypatch.setattr(upstream, "_loop", asyncio.get_running_loop())
+
+    yield handler, install
+    upstream._clients.clear()
+
+
+async def _stream_once(url):
+    async with upstream.stream("gbfs", url) as r:
+        await r.aread()
+
+
+def test_server_errors_on_a_stream_open_the_breaker(mock_pool):
+    handler, install = mock_pool
+    handler["fn"] = lambda request: httpx.Response(503)
+    url = "https://gbfs.example/gbfs.json"
+
+    async def main():
+        await install()
+        b = breaker.breaker_for("gbfs")
+        for _ in range(b.failures):
+            with pytest.raises(httpx.HTTPStatusError):
+                await _stream_once(url)
+        assert b.state == "open"
+        with pytest.raises(upstream.CircuitOpen):
+            await _stream_once(url)
+
+    asyncio.run(main())
+
+
+def test_client_errors_on_a_stream_leave_the_breaker_closed(mock_pool):
+    handler, install = mock_pool
+    handler["fn"] = lambda request: httpx.Response(404)
+
+    async def main():
+        await install()
+        b = breaker.breaker_for("gbfs")
+        for _ in range(b.failures + 1):
+            with pytest.raises(httpx.HTTPStatusError):
+                await _stream_once("https://gbfs.example/missing.json")
+        assert b.state == "closed"
+
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import asyncio
+
+from backend import store, wmata
+from backend.cache import Cache
+
+STATIONS = {"Stations": [
+    {"Code": "A01", "Name": "Metro Center", "Lat": 38.8983, "Lon": -77.0281, "StationTogether1": "C01"},
+    {"Code": "C01", "Name": "Metro Center", "Lat": 38.8983, "Lon": -77.0281, "StationTogether1": ""},
+    {"Code": "D01", "Name": "Federal Triangle", "Lat": 38.8932, "Lon": -77.0282, "StationTogether1": ""},
+]}
+
+
+def test_persisted_station_metadata_warms_the_cache(data_dir, fresh_cache, upstream, monkeypatch):
+    upstream.routes["jStations"] = STATIONS
+    first = asyncio.run(wmata._stations_meta())
+    assert upstream.count("jStations") == 1
+
+    # A restart: an empty cache seeded from disk
+    from backend.cache import Cache
+    restarted = Cache()
+    monkeypatch.setattr(wmata, "cache", restarted)
+    assert store.warm(restarted) >= 1
+    assert asyncio.run(wmata._stations_meta()) == first
+    assert upstream.count("jStations") == 1
+
+
+def _trains(url):
+    codes = url.rsplit("/", 1)[-1].split(",")
+    return {"Trains": [{"LocationCode": c, "Line": "RD", "DestinationName": "Glenmont", "Min": "4",
+                        "Car": "8", "Group": "1"} for c in codes]}
+
+
+def test_profiles_sharing_a_station_share_its_predictions(data_dir, fresh_cache, upstream, monkeypatch):
+    monkeypatch.setenv("WMATA_API_KEY", "test")
+    upstream.routes.update({"jStations": STATIONS, "GetPrediction": _trains})
+
+    async def boards():
+        both = await wmata.rail_predictions_async({"rail": {"favorites": ["A01", "D01"]}})
+        one = await wmata.rail_predictions_async({"rail": {"favorites": ["D01"]}})
+        return both, one
+
+    both, one = asyncio.run(boards())
+    # One batched call covers A01, its transfer code C01 and D01
+    assert upstream.count("GetPrediction") == 1
+    assert [s.code for s in both["stations"]] == ["A01", "D01"]
+    assert one["stations"][0].arrivals == both["stations"][1].arrivals
+
+
+def test_a_batch_publishes_every_station_to_other_workers(data_dir, fresh_cache, upstream, monkeypatch, tmp_path):
+    monkeypatch.setenv("WMATA_API_KEY", "test")
+    upstream.routes.update({"jStations": STATIONS, "GetPrediction": _trains})
+    workers = [Cache(), Cache()]
+    for c in workers:
+        c.configure(shared=str(tmp_path / "shared.db"))
+
+    async def boards():
+        monkeypatch.setattr(wmata, "cache", workers[0])
+        # D01 is still fresh here, so only A01 and C01 send this worker to WMATA
+        workers[0].put("rail_D01", [])
+        await wmata.rail_predictions_async({"rail": {"favorites": ["A01", "D01"]}})
+        monkeypatch.setattr(wmata, "cache", workers[1])
+        return await wmata.rail_predictions_async({"rail": {"favorites": ["D01"]}})
+
+    d01 = asyncio.run(boards())
+    assert upstream.count("GetPrediction") == 1
+    assert [a.minutes for a in d01["stations"][0].arrivals] == [4]